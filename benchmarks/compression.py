@@ -0,0 +1,80 @@
+"""Bytes saved by template minification and response compression, and the
+CPU each codec spends per response, on the fixture catalog with the production settings.
+
+    $ python benchmarks/compression.py --iterations 200
+"""
+import argparse
+import copy
+import json
+import os
+import time
+
+from utils import setup_django, test_database
+
+
+def cpu_ms(func, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return round((time.process_time() - started) * 1000 / iterations, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transpozon.settings_production')
+    os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark')
+    setup_django()
+
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    from shop.middleware import CODECS
+    from shop.models import Product, Subcategory
+
+    # The same cached loader without minification.
+    unminified = copy.deepcopy(settings.TEMPLATES)
+    unminified[0]['APP_DIRS'] = False
+    unminified[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+    # One process needs no shared cache.
+    local_cache = {'default': {'BACKEND': 'shop.metrics.LocMemCache'}}
+
+    results = {}
+    with override_settings(CACHES=local_cache), test_database():
+        client = Client()
+        pages = {
+            'home': '/',
+            'product_list': Subcategory.objects.first().path,
+            'product': Product.objects.first().path,
+        }
+
+        for name, path in pages.items():
+            with override_settings(TEMPLATES=unminified):
+                raw = client.get(path).content
+            minified = client.get(path).content
+            render_ms = cpu_ms(lambda: client.get(path), args.iterations)
+
+            result = {
+                'raw_bytes': len(raw),
+                'minified_bytes': len(minified),
+                'render_cpu_ms': render_ms,
+            }
+            for encoding, (compress, _) in CODECS.items():
+                result[f'{encoding}_bytes'] = len(compress(minified))
+                result[f'{encoding}_cpu_ms'] = cpu_ms(lambda: compress(minified), args.iterations)
+            results[name] = result
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Render time and query count of HomeView on the fixture catalog.
+
+    $ python benchmarks/home_view.py --iterations 500
+"""
+import argparse
+import json
+
+from utils import measure, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth.models import AnonymousUser
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+
+    from shop.views import HomeView
+
+    view = HomeView.as_view()
+    factory = RequestFactory()
+
+    def render():
+        request = factory.get('/')
+        request.user = AnonymousUser()
+        view(request).render()
+
+    with test_database():
+        render()
+        with CaptureQueriesContext(connection) as queries:
+            render()
+        result = measure(render, args.iterations)
+        result['queries'] = len(queries)
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
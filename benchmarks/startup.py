@@ -0,0 +1,86 @@
+"""Cold start of a worker: import time of the WSGI application and latency
+of the first requests, each measured in a fresh interpreter.
+
+Requests go to the configured database, so migrate and load the fixtures
+first. The production settings expect memcached at DJANGO_MEMCACHED_LOCATION.
+
+    $ python benchmarks/startup.py --runs 5
+    $ python benchmarks/startup.py --settings transpozon.settings_production --path / --path /cart/
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from utils import BASE_DIR
+
+DEFAULT_SETTINGS = ('transpozon.settings', 'transpozon.settings_production')
+
+
+def child(paths):
+    started = time.perf_counter()
+    from transpozon.wsgi import application
+    imported = time.perf_counter()
+
+    from wsgiref.util import setup_testing_defaults
+
+    def request(path):
+        environ = {'PATH_INFO': path}
+        setup_testing_defaults(environ)
+        started = time.perf_counter()
+        body = application(environ, lambda status, headers: None)
+        b''.join(body)
+        body.close()
+        return (time.perf_counter() - started) * 1000
+
+    result = {'import_ms': (imported - started) * 1000}
+    for path in paths:
+        result[f'first {path}'] = request(path)
+        result[f'second {path}'] = request(path)
+    print(json.dumps(result))
+
+
+def run(settings_module, paths, runs):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': settings_module,
+        'DJANGO_ALLOWED_HOSTS': '127.0.0.1',
+        'DJANGO_SECRET_KEY': os.environ.get('DJANGO_SECRET_KEY', 'benchmark'),
+    }
+    command = [sys.executable, os.path.abspath(__file__), '--child']
+    for path in paths:
+        command += ['--path', path]
+
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(command, env=env, cwd=BASE_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+
+    return {key: round(statistics.median(sample[key] for sample in samples), 3) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', action='append')
+    parser.add_argument('--path', action='append')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    paths = args.path or ['/']
+
+    if args.child:
+        sys.path.insert(0, BASE_DIR)
+        child(paths)
+        return
+
+    results = {settings_module: run(settings_module, paths, args.runs)
+               for settings_module in args.settings or DEFAULT_SETTINGS}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,19 @@
-from django.contrib import admin
+import csv
+from datetime import timedelta
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied
+from django.db.models import Sum
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
 
 from shop import models
+from shop.forms import PriceChangeForm
 
 
 class OrderProducts(admin.TabularInline):
@@ -26,6 +39,33 @@ class UserAdmin(admin.ModelAdmin):
 class ProductAdmin(admin.ModelAdmin):
     inlines = (Articles,)
     prepopulated_fields = {'slug': ['title']}
+    list_display = ('title', 'subcategory', 'price')
+    list_filter = ('category', 'subcategory')
+    search_fields = ('title',)
+    actions = ('change_prices',)
+
+    def change_prices(self, request, queryset):
+        form = PriceChangeForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            prices = {product_id: form.new_price(price)
+                      for product_id, price in queryset.values_list('id', 'price').iterator()}
+            changed = models.Product.set_prices(prices)
+            self.message_user(request, f'Цены изменены у товаров: {changed}')
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Изменение цен',
+            'opts': self.model._meta,
+            'form': form,
+            'count': queryset.count(),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/shop/change_prices.html', context)
+
+    change_prices.short_description = 'Изменить цены выбранных товаров'
 
 
 @admin.register(models.Article)
@@ -48,8 +88,172 @@ class ReviewAdmin(admin.ModelAdmin):
     pass
 
 
+def export_orders(modeladmin, request, queryset):
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{modeladmin.model._meta.db_table}.csv"'
+    writer = csv.writer(response)
+    writer.writerow(['order', 'date_created', 'customer', 'product', 'quantity', 'price'])
+    line_model = models.ArchivedOrderProducts if queryset.model is models.ArchivedOrder else models.OrderProducts
+    lines = line_model.objects. \
+        filter(order__in=queryset). \
+        order_by('order_id', 'id'). \
+        values_list('order_id', 'order__date_created', 'order__customer__email', 'product__title', 'quantity',
+                    'price')
+    writer.writerows(lines.iterator())
+    return response
+
+
+export_orders.short_description = 'Выгрузить выбранные заказы в CSV'
+
+
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
     inlines = [
         OrderProducts
     ]
+    actions = (export_orders,)
+
+
+class ArchivedOrderProducts(admin.TabularInline):
+    model = models.ArchivedOrderProducts
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'date_created', 'date_archived')
+    list_select_related = ('customer',)
+    date_hierarchy = 'date_created'
+    search_fields = ('=id', 'customer__email')
+    inlines = (ArchivedOrderProducts,)
+    actions = ('restore', export_orders)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def restore(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        skipped = models.ArchivedOrder.restore(ids)
+        self.message_user(request, f'Заказов восстановлено: {len(ids) - len(skipped)}')
+        if skipped:
+            self.message_user(request, f'Номера уже заняты, заказы остались в архиве: {", ".join(map(str, skipped))}',
+                              messages.WARNING)
+
+    restore.short_description = 'Вернуть выбранные заказы из архива'
+
+
+@admin.register(models.Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'locked_until', 'date_created', 'date_finished')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'arguments')
+    readonly_fields = ('date_created', 'date_finished', 'last_error')
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=models.Task.RUNNING).update(
+            status=models.Task.PENDING, attempts=0, locked_until=None, run_after=timezone.now()
+        )
+        self.message_user(request, f'Задач поставлено в очередь: {updated}')
+
+    retry.short_description = 'Перезапустить выбранные задачи'
+
+
+@admin.register(models.ProductRanking)
+class ProductRankingAdmin(admin.ModelAdmin):
+    list_display = ('rank', 'product', 'views', 'units_sold', 'score')
+    list_select_related = ('product__subcategory',)
+
+
+@admin.register(models.DailyCategorySales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    period_options = (7, 30, 90, 365)
+    top_products = 20
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        # A year at most; a huge value would overflow the date arithmetic.
+        days = max(1, min(days, 366))
+        since = timezone.localdate() - timedelta(days=days - 1)
+        totals = ('units', 'revenue', 'orders')
+
+        category_sales = models.DailyCategorySales.objects.filter(day__gte=since)
+        product_sales = models.DailyProductSales.objects.filter(day__gte=since)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': self.model._meta.verbose_name_plural.capitalize(),
+            'opts': self.model._meta,
+            'days': days,
+            'since': since,
+            'period_options': self.period_options,
+            'totals': category_sales.aggregate(units=Sum('units'), revenue=Sum('revenue')),
+            'by_day': category_sales.values('day').
+            annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-day'),
+            'by_category': category_sales.values('category__title').
+            annotate(**{field: Sum(field) for field in totals}).order_by('-revenue'),
+            'top_products': product_sales.values('product__title').
+            annotate(**{field: Sum(field) for field in totals}).order_by('-revenue')[:self.top_products],
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/shop/sales_dashboard.html', context)
+
+
+@admin.register(models.ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = ('date_created', 'method', 'path', 'url_name', 'status_code', 'duration', 'query_count',
+                    'query_time', 'download')
+    list_filter = ('url_name', 'method', 'status_code')
+    search_fields = ('path',)
+    exclude = ('filename',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/',
+                 self.admin_site.admin_view(self.download_view),
+                 name='shop_profilereport_download'),
+        ] + super().get_urls()
+
+    def download(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse('admin:shop_profilereport_download', args=[obj.pk]),
+                           obj.filename)
+
+    download.short_description = 'файл профиля'
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        report = get_object_or_404(models.ProfileReport, pk=pk)
+        try:
+            return FileResponse(open(report.file_path, 'rb'), as_attachment=True, filename=report.filename)
+        except FileNotFoundError:
+            raise Http404
@@ -0,0 +1,66 @@
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# Everything cached from the catalog.
+CATALOG_GENERATION = 'catalog'
+# Products, categories, subcategories and articles, but not reviews: the
+# feeds and sitemaps.
+FEEDS_GENERATION = 'feeds'
+# Titles and paths of products, categories, subcategories and articles;
+# reviews and prices leave it alone.
+TITLES_GENERATION = 'titles'
+
+
+def generations():
+    # shop.models imports this module.
+    return apps.get_model('shop', 'CatalogGeneration').objects
+
+
+def generation_key(name):
+    return f'{name}:generation'
+
+
+def load_generation(name):
+    value = generations().filter(name=name).values_list('value', flat=True).first()
+    if value is None:
+        try:
+            with transaction.atomic():
+                value = generations().create(name=name, value=int(time.time())).value
+        except IntegrityError:
+            value = generations().get(name=name).value
+    return value
+
+
+def generation(name):
+    value = cache.get(generation_key(name))
+    if value is None:
+        value = load_generation(name)
+        # A copy that a worker missed the bump of expires after the timeout.
+        cache.add(generation_key(name), value, settings.CATALOG_GENERATION_TIMEOUT)
+    return value
+
+
+def bump_generation(name):
+    if not generations().filter(name=name).update(value=F('value') + 1):
+        load_generation(name)
+        generations().filter(name=name).update(value=F('value') + 1)
+    cache.delete(generation_key(name))
+    # Others may have read the old value before the transaction committed.
+    transaction.on_commit(lambda: cache.delete(generation_key(name)))
+
+
+def catalog_generation():
+    return generation(CATALOG_GENERATION)
+
+
+def bump_catalog_generation():
+    bump_generation(CATALOG_GENERATION)
+
+
+def catalog_key(*parts):
+    return ':'.join(['catalog', str(catalog_generation()), *map(str, parts)])
@@ -1,12 +1,15 @@
-from .models import Product
+from django.db.models.functions import Substr
+
+from .managers import ProductQuerySet
+from .models import CartLine
 
 
 class Item:
 
-    def __init__(self, product, qty):
+    def __init__(self, product, qty, description):
         self.id = product.id
         self.title = product.title
-        self.description = product.description
+        self.description = description
         self.price = product.price
         self.image = product.image.url
         self.url = product.get_absolute_url()
@@ -27,28 +30,37 @@ class Item:
 
 class Cart:
 
-    def __init__(self, session_cart):
-        self.raw_cart = session_cart
+    def __init__(self, owner):
+        self.owner = owner
         self.items = []
         self.item_qty = 0
         self.subtotal = 0
 
-        self.initialize_cart()
+        if owner:
+            self.initialize_cart()
 
     def initialize_cart(self):
-        cart_products = Product.objects.\
-            filter(id__in=self.raw_cart.keys()).\
-            prefetch_related('category', 'subcategory')
-
-        for product in cart_products:
-            qty = self.raw_cart[str(product.id)]
-            item = Item(product, qty)
-            self.item_qty += qty
+        # Cart, lines and products in one joined query.
+        lines = CartLine.for_owner(self.owner). \
+            select_related('product'). \
+            only('quantity', *(f'product__{field}' for field in ProductQuerySet.LISTING_FIELDS)). \
+            annotate(summary=Substr('product__description', 1, ProductQuerySet.CART_SUMMARY_LENGTH)). \
+            order_by('id')
+
+        for line in lines:
+            item = Item(line.product, line.quantity, line.summary)
+            self.item_qty += line.quantity
             self.subtotal += item.total_price
             self.items.append(item)
 
+    def quantities(self):
+        return {item.id: item.qty for item in self.items}
+
     def __str__(self):
-        return {self.raw_cart}
+        return ' '.join(map(str, self.items))
+
+    def __bool__(self):
+        return bool(self.items)
 
     def __eq__(self, other):
         if self.items == other.items:
@@ -1,6 +1,14 @@
-from .models import Category
+from django.db.models import Prefetch
+
+from .models import Category, Subcategory
 
 
 def navbar(httprequest):
-    categories = Category.objects.order_by('-id').prefetch_related('subcategories')
+    if getattr(httprequest, 'partial', False):
+        return {}
+
+    subcategories = Subcategory.objects.only('id', 'title', 'path', 'category_id')
+    categories = Category.objects.order_by('-id'). \
+        only('id', 'title', 'path'). \
+        prefetch_related(Prefetch('subcategories', subcategories))
     return {'navbar_categories': categories}
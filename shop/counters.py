@@ -0,0 +1,71 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+
+    def __init__(self, flush_interval, flush_threshold):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.hits = 0
+        self.last_flush = time.monotonic()
+
+    def hit(self, product_id):
+        with self.lock:
+            self.pending[product_id] += 1
+            self.hits += 1
+            if self.hits < self.flush_threshold and \
+                    time.monotonic() - self.last_flush < self.flush_interval:
+                return
+            pending = self.take()
+
+        self.write(pending)
+
+    def flush(self):
+        with self.lock:
+            pending = self.take()
+        self.write(pending)
+
+    def take(self):
+        pending, self.pending = self.pending, Counter()
+        self.hits = 0
+        self.last_flush = time.monotonic()
+        return pending
+
+    def write(self, pending):
+        # One UPDATE per distinct increment instead of one per product.
+        by_increment = defaultdict(list)
+        for product_id, count in pending.items():
+            by_increment[count].append(product_id)
+
+        while by_increment:
+            count, product_ids = by_increment.popitem()
+            try:
+                Product.objects.filter(id__in=product_ids).update(views=F('views') + count)
+            except DatabaseError:
+                logger.exception('Could not flush product views, keeping them for the next flush')
+                by_increment[count] = product_ids
+                with self.lock:
+                    for unwritten, ids in by_increment.items():
+                        self.pending.update(dict.fromkeys(ids, unwritten))
+                return
+
+
+product_views = ViewCounter(
+    flush_interval=settings.VIEW_COUNTER_FLUSH_INTERVAL,
+    flush_threshold=settings.VIEW_COUNTER_FLUSH_THRESHOLD,
+)
+atexit.register(product_views.flush)
@@ -0,0 +1,224 @@
+import csv
+import fcntl
+import glob
+import hashlib
+import os
+import re
+import threading
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import FEEDS_GENERATION, generation
+from .models import Article, Category, Product, Subcategory
+from .tasks import build_feed
+
+PRODUCTS_SITEMAP = re.compile(r'^sitemap-products-(\d+)\.xml$')
+
+
+def feed_path(name, base_url, feed_generation):
+    site = hashlib.md5(base_url.encode()).hexdigest()[:8]
+    return os.path.join(settings.FEED_CACHE_DIR, f'{feed_generation}-{site}-{name}')
+
+
+def cached_file(name, base_url):
+    # Returns the file opened for reading. Files are written once per feeds
+    # generation and site. While the file of the current generation is
+    # written by a task, the newest older one is served; only when there
+    # is none does the request write it, and other workers wait on its
+    # lock file. Removing older files leaves copies already open readable.
+    current = generation(FEEDS_GENERATION)
+    path = feed_path(name, base_url, current)
+
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        pass
+
+    if previous := latest_file(path, current):
+        # One task per file and generation, whoever notices first.
+        if cache.add(f'feeds:{current}:queued:{os.path.basename(path)}', 1, settings.FEED_BUILD_TIMEOUT):
+            build_feed.delay(name, base_url)
+        try:
+            return open(previous, 'rb')
+        except FileNotFoundError:
+            pass
+
+    build(name, base_url, current)
+    return open(path, 'rb')
+
+
+def latest_file(path, current):
+    _, suffix = os.path.basename(path).split('-', 1)
+    older = []
+    for candidate in glob.glob(os.path.join(settings.FEED_CACHE_DIR, f'*-{glob.escape(suffix)}')):
+        prefix = os.path.basename(candidate).split('-', 1)[0]
+        if prefix.isdigit() and int(prefix) < current:
+            older.append((int(prefix), candidate))
+    return max(older)[1] if older else None
+
+
+def build(name, base_url, feed_generation=None):
+    if feed_generation is None:
+        feed_generation = generation(FEEDS_GENERATION)
+    path = feed_path(name, base_url, feed_generation)
+
+    os.makedirs(settings.FEED_CACHE_DIR, exist_ok=True)
+    lock_path = f'{path}.lock'
+    with open(lock_path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                write(path, name, base_url)
+        finally:
+            # Whoever comes later finds the file, or tries again.
+            remove_file(lock_path)
+
+    remove_stale(feed_generation)
+
+
+def write(path, name, base_url):
+    temp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as fh:
+            writer(name)(fh, base_url)
+        os.replace(temp_path, path)
+    finally:
+        remove_file(temp_path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale(feed_generation):
+    # Only older generations: a worker that has not seen the latest bump
+    # yet must not remove the files of the others.
+    for path in glob.glob(os.path.join(settings.FEED_CACHE_DIR, '*')):
+        name = os.path.basename(path)
+        prefix = name.split('-', 1)[0]
+        if prefix.isdigit() and int(prefix) < feed_generation and not name.endswith('.tmp'):
+            remove_file(path)
+
+
+def product_chunk_starts():
+    # The first product id of every sitemap chunk. Each step skips at most
+    # SITEMAP_CHUNK_SIZE rows of the primary key index, however far into
+    # the catalog the chunk is.
+    key = f'feeds:{generation(FEEDS_GENERATION)}:sitemap-chunks'
+    starts = cache.get(key)
+    if starts is None:
+        ids = Product.objects.order_by('id').values_list('id', flat=True)
+        starts = []
+        start = ids.first()
+        while start is not None:
+            starts.append(start)
+            start = next(iter(ids.filter(id__gte=start)[settings.SITEMAP_CHUNK_SIZE:][:1]), None)
+        cache.set(key, starts, settings.CATALOG_CACHE_TIMEOUT)
+    return starts
+
+
+def product_chunks():
+    return max(1, len(product_chunk_starts()))
+
+
+def write_sitemap_index(fh, base_url):
+    sections = ['pages', *(f'products-{chunk}' for chunk in range(1, product_chunks() + 1))]
+    lastmod = timezone.now().date().isoformat()
+
+    fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for section in sections:
+        fh.write(f'<sitemap><loc>{escape(base_url)}/sitemap-{section}.xml</loc>'
+                 f'<lastmod>{lastmod}</lastmod></sitemap>\n')
+    fh.write('</sitemapindex>\n')
+
+
+def write_urlset(fh, base_url, paths):
+    fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for path in paths:
+        fh.write(f'<url><loc>{escape(base_url + path)}</loc></url>\n')
+    fh.write('</urlset>\n')
+
+
+def write_pages_sitemap(fh, base_url):
+    def paths():
+        yield '/'
+        for model in (Category, Subcategory, Article):
+            yield from model.objects.order_by('id').values_list('path', flat=True).iterator()
+
+    write_urlset(fh, base_url, paths())
+
+
+def products_sitemap_writer(chunk):
+    def write(fh, base_url):
+        starts = product_chunk_starts()
+        products = Product.objects.filter(id__gte=starts[chunk - 1]) if starts else Product.objects.none()
+        if chunk < len(starts):
+            products = products.filter(id__lt=starts[chunk])
+        paths = products.order_by('id').values_list('path', flat=True)
+        write_urlset(fh, base_url, paths.iterator(chunk_size=settings.FEED_BATCH_SIZE))
+
+    return write
+
+
+def feed_rows():
+    return Product.objects. \
+        order_by('id'). \
+        values_list('id', 'title', 'price', 'path', 'image', 'subcategory_id', 'subcategory__title'). \
+        iterator(chunk_size=settings.FEED_BATCH_SIZE)
+
+
+def write_csv_feed(fh, base_url):
+    writer = csv.writer(fh)
+    writer.writerow(['id', 'title', 'price', 'currency', 'url', 'image', 'category'])
+    for product_id, title, price, path, image, _, subcategory in feed_rows():
+        writer.writerow([product_id, title, price, 'RUB', base_url + path,
+                         base_url + settings.MEDIA_URL + image, subcategory])
+
+
+def write_yml_feed(fh, base_url):
+    fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+             f'<yml_catalog date={quoteattr(timezone.now().strftime("%Y-%m-%dT%H:%M"))}>\n'
+             '<shop>\n'
+             '<name>Транспозон</name>\n'
+             '<company>Транспозон</company>\n'
+             f'<url>{escape(base_url)}/</url>\n'
+             '<currencies><currency id="RUR" rate="1"/></currencies>\n'
+             '<categories>\n')
+    for subcategory_id, title in Subcategory.objects.order_by('id').values_list('id', 'title').iterator():
+        fh.write(f'<category id="{subcategory_id}">{escape(title)}</category>\n')
+    fh.write('</categories>\n'
+             '<offers>\n')
+    for product_id, title, price, path, image, subcategory_id, _ in feed_rows():
+        fh.write(f'<offer id="{product_id}" available="true">'
+                 f'<url>{escape(base_url + path)}</url>'
+                 f'<price>{price}</price>'
+                 '<currencyId>RUR</currencyId>'
+                 f'<categoryId>{subcategory_id}</categoryId>'
+                 f'<picture>{escape(base_url + settings.MEDIA_URL + image)}</picture>'
+                 f'<name>{escape(title)}</name>'
+                 '</offer>\n')
+    fh.write('</offers>\n'
+             '</shop>\n'
+             '</yml_catalog>\n')
+
+
+WRITERS = {
+    'sitemap.xml': write_sitemap_index,
+    'sitemap-pages.xml': write_pages_sitemap,
+    'feed.csv': write_csv_feed,
+    'feed.yml': write_yml_feed,
+}
+
+
+def writer(name):
+    if match := PRODUCTS_SITEMAP.match(name):
+        return products_sitemap_writer(int(match[1]))
+    return WRITERS[name]
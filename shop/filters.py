@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import catalog_key
+from .forms import ProductFilterForm
+
+
+class ProductFilter:
+    default_sort = '-title'
+
+    def __init__(self, params):
+        self.form = ProductFilterForm(params)
+        self.params = self.form.cleaned_data if self.form.is_valid() else {}
+
+        self.price = self.params.get('price')
+        self.rating = self.params.get('rating')
+        self.sort = self.params.get('sort') or self.default_sort
+
+    @property
+    def key(self):
+        return f'{self.price}:{self.rating}:{self.sort}'
+
+    @staticmethod
+    def price_q(bucket):
+        if bucket is None:
+            return Q()
+
+        low, high = ProductFilterForm.PRICE_BUCKETS[bucket]
+        q = Q()
+        if low is not None:
+            q &= Q(price__gte=low)
+        if high is not None:
+            q &= Q(price__lt=high)
+        return q
+
+    @staticmethod
+    def rating_q(floor):
+        if floor is None:
+            return Q()
+        return Q(rating__gte=floor)
+
+    def filter(self, queryset):
+        queryset = queryset.filter(self.price_q(self.price) & self.rating_q(self.rating))
+        return queryset.order_by(self.sort, 'id')
+
+    def facets(self, queryset, subcategory):
+        key = catalog_key('facets', subcategory.id, self.key)
+        facets = cache.get(key)
+        if facets is None:
+            facets = self.count_facets(queryset)
+            cache.set(key, facets, settings.CATALOG_CACHE_TIMEOUT)
+        return facets
+
+    def count_facets(self, queryset):
+        # Each facet is counted with the other facet's filter applied,
+        # so a single aggregate query covers both groups.
+        price_filter = self.price_q(self.price)
+        rating_filter = self.rating_q(self.rating)
+
+        aggregates = {}
+        for bucket in range(len(ProductFilterForm.PRICE_BUCKETS)):
+            aggregates[f'price_{bucket}'] = Count('id', filter=self.price_q(bucket) & rating_filter)
+        for floor in ProductFilterForm.RATING_FLOORS:
+            aggregates[f'rating_{floor}'] = Count('id', filter=self.rating_q(floor) & price_filter)
+
+        counts = queryset.order_by().aggregate(**aggregates)
+
+        return {
+            'price': [
+                {'value': bucket, 'low': low, 'high': high, 'count': counts[f'price_{bucket}'],
+                 'active': bucket == self.price}
+                for bucket, (low, high) in enumerate(ProductFilterForm.PRICE_BUCKETS)
+            ],
+            'rating': [
+                {'value': floor, 'count': counts[f'rating_{floor}'], 'active': floor == self.rating}
+                for floor in ProductFilterForm.RATING_FLOORS
+            ],
+        }
@@ -18,3 +18,67 @@ class FeedbackForm(forms.ModelForm):
             'rating': forms.RadioSelect,
             'product': forms.HiddenInput,
         }
+
+
+class PriceChangeForm(forms.Form):
+    PERCENT = 'percent'
+    FIXED = 'fixed'
+
+    kind = forms.ChoiceField(
+        choices=((PERCENT, 'на процент'), (FIXED, 'на сумму, руб.')),
+        label='Изменить цену',
+    )
+    amount = forms.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        label='Величина',
+        help_text='Отрицательное значение снижает цену.',
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('kind') == self.PERCENT and cleaned_data.get('amount', 0) <= -100:
+            raise forms.ValidationError('Цену нельзя снизить на 100% и больше.')
+        return cleaned_data
+
+    def new_price(self, price):
+        amount = self.cleaned_data['amount']
+        if self.cleaned_data['kind'] == self.PERCENT:
+            price = price * (100 + amount) / 100
+        else:
+            price = price + amount
+        return max(int(price.quantize(1)), 0)
+
+
+class ProductFilterForm(forms.Form):
+    PRICE_BUCKETS = (
+        (None, 5000),
+        (5000, 15000),
+        (15000, 40000),
+        (40000, None),
+    )
+    RATING_FLOORS = (4, 3, 2, 1)
+    SORTING = (
+        ('-title', 'По названию (Я-А)'),
+        ('title', 'По названию (А-Я)'),
+        ('price', 'Сначала дешевые'),
+        ('-price', 'Сначала дорогие'),
+        ('-rating', 'По рейтингу'),
+    )
+
+    price = forms.TypedChoiceField(
+        choices=[(str(i), str(i)) for i in range(len(PRICE_BUCKETS))],
+        coerce=int,
+        empty_value=None,
+        required=False,
+    )
+    rating = forms.TypedChoiceField(
+        choices=[(str(r), str(r)) for r in RATING_FLOORS],
+        coerce=int,
+        empty_value=None,
+        required=False,
+    )
+    sort = forms.ChoiceField(
+        choices=SORTING,
+        required=False,
+    )
@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import ArchivedOrder
+
+
+class Command(BaseCommand):
+    help = ('Move orders older than --days to the archive tables in small batches. '
+            'Safe to interrupt and run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help='Archive orders older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Orders moved per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.5,
+                            help='Seconds to pause between batches so checkouts are not blocked.')
+        parser.add_argument('--limit', type=int,
+                            help='Stop after about this many orders.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total = 0
+
+        while moved := ArchivedOrder.archive(cutoff, options['batch_size']):
+            total += moved
+            self.stdout.write(f'Archived {total} orders')
+            if options['limit'] and total >= options['limit']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} orders archived'))
@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import SavedCart
+
+
+class Command(BaseCommand):
+    help = ('Delete anonymous carts not changed for --days in small batches. '
+            'Customer carts are kept.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CART_EXPIRE_AFTER_DAYS,
+                            help='Delete carts not changed for this many days.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Carts deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.5,
+                            help='Seconds to pause between batches so cart writes are not blocked.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total = 0
+
+        while deleted := SavedCart.expire(cutoff, options['batch_size']):
+            total += deleted
+            self.stdout.write(f'Deleted {total} carts')
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} carts deleted'))
@@ -0,0 +1,261 @@
+import bisect
+import contextlib
+import itertools
+import math
+import os
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Avg, Max, OuterRef, Subquery
+from django.urls import reverse
+from django.utils import timezone
+
+from shop.cache import FEEDS_GENERATION, TITLES_GENERATION, bump_catalog_generation, bump_generation
+from shop.models import (ArchivedOrder, ArchivedOrderProducts, Article, Category, DailyCategorySales,
+                         DailyProductSales, Feedback, Order, OrderProducts, Product, Subcategory, User)
+
+WORDS = ('альфа', 'бета', 'гамма', 'дельта', 'омега', 'нова', 'макс', 'про', 'лайт', 'ультра', 'мини',
+         'плюс', 'эйр', 'нео', 'стар', 'вектор', 'квант', 'сигма', 'турбо', 'зенит')
+LATIN = ('alfa', 'beta', 'gamma', 'delta', 'omega', 'nova', 'max', 'pro', 'lite', 'ultra', 'mini',
+         'plus', 'air', 'neo', 'star', 'vektor', 'kvant', 'sigma', 'turbo', 'zenit')
+TEXT = ('Lorem ipsum dolor sit amet, consectetur adipisicing elit. A ab adipisci aliquam aliquid '
+        'architecto atque blanditiis consectetur consequuntur dicta dolores dolorum ducimus ea error.')
+NAMES = ('Иван', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Анна', 'Сергей', 'Елена')
+PLACEHOLDER_COLORS = ('#6c757d', '#007bff', '#28a745', '#dc3545', '#ffc107', '#17a2b8', '#343a40', '#e83e8c')
+
+# Rows created at scale 1.
+BASE_COUNTS = {
+    'categories': 10,
+    'subcategories': 100,
+    'products': 10000,
+    'articles': 200,
+    'users': 5000,
+    'feedback': 20000,
+    'orders': 20000,
+}
+ARTICLE_PRODUCTS = 5
+MAX_ORDER_LINES = 5
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic catalog, users, reviews and orders. '
+            'Scale 1 creates about 100 000 rows, scale 10 about a million.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Orders are spread over this many past days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.days = options['days']
+        self.now = timezone.now()
+        counts = {name: max(1, math.ceil(count * options['scale'])) for name, count in BASE_COUNTS.items()}
+        started = time.monotonic()
+
+        with transaction.atomic():
+            categories = self.create_categories(counts['categories'])
+            subcategories = self.create_subcategories(categories, counts['subcategories'])
+            products = self.create_products(subcategories, counts['products'])
+            self.product_weights = popularity(len(products))
+            self.step('articles', lambda: self.create_articles(subcategories, products, counts['articles']))
+            users = self.create_users(counts['users'])
+            self.user_weights = popularity(len(users))
+            self.step('feedback', lambda: self.create_feedback(products, counts['feedback']))
+            self.step('orders', lambda: self.create_orders(users, products, counts['orders']))
+            self.reset_sequences()
+
+        self.step('rollups', self.rebuild_rollups)
+        bump_catalog_generation()
+        bump_generation(FEEDS_GENERATION)
+        bump_generation(TITLES_GENERATION)
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.monotonic() - started:.1f} s'))
+
+    def step(self, name, func):
+        started = time.monotonic()
+        result = func()
+        self.stdout.write(f'{name}: {time.monotonic() - started:.1f} s')
+        return result
+
+    def bulk_create(self, model, objects):
+        started = time.monotonic()
+        created = 0
+        iterator = iter(objects)
+        while batch := list(itertools.islice(iterator, self.batch_size)):
+            model.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(f'{model._meta.db_table}: {created} rows in {time.monotonic() - started:.1f} s')
+
+    @staticmethod
+    def next_id(*models):
+        # Archived orders keep their ids and may come back.
+        return max(model.objects.aggregate(last=Max('id'))['last'] or 0 for model in models) + 1
+
+    def title(self, words):
+        indexes = [self.random.randrange(len(WORDS)) for _ in range(words)]
+        return ' '.join(WORDS[i] for i in indexes).capitalize(), '-'.join(LATIN[i] for i in indexes)
+
+    def skewed(self, items, cum_weights):
+        # cum_weights come from popularity(len(items)).
+        return items[bisect.bisect(cum_weights, self.random.random() * cum_weights[-1])]
+
+    def random_date(self):
+        # Recent days get more orders than old ones.
+        days_ago = int(self.days * self.random.random() ** 2)
+        return self.now - timedelta(days=days_ago, seconds=self.random.randrange(86400))
+
+    def create_categories(self, count):
+        first_id = self.next_id(Category)
+        categories = []
+        for pk in range(first_id, first_id + count):
+            title, slug = self.title(1)
+            slug = f'{slug}-{pk}'
+            categories.append(Category(id=pk, title=f'{title} {pk}', slug=slug,
+                                       path=reverse('category', args=[slug])))
+        self.bulk_create(Category, categories)
+        return categories
+
+    def create_subcategories(self, categories, count):
+        first_id = self.next_id(Subcategory)
+        subcategories = []
+        for pk in range(first_id, first_id + count):
+            category = self.random.choice(categories)
+            title, slug = self.title(2)
+            slug = f'{slug}-{pk}'
+            subcategories.append(Subcategory(id=pk, title=f'{title} {pk}', slug=slug, category=category,
+                                             path=reverse('subcategory', args=[category.slug, slug])))
+        self.bulk_create(Subcategory, subcategories)
+        return subcategories
+
+    def create_products(self, subcategories, count):
+        images = self.placeholder_images()
+        first_id = self.next_id(Product)
+        products = []
+        for pk in range(first_id, first_id + count):
+            subcategory = self.random.choice(subcategories)
+            title, slug = self.title(3)
+            slug = f'{slug}-{pk}'
+            products.append(Product(
+                id=pk,
+                title=f'{title} {pk}',
+                slug=slug,
+                description=TEXT,
+                price=int(self.random.lognormvariate(9.5, 1)) // 10 * 10 + 990,
+                image=self.random.choice(images),
+                category_id=subcategory.category_id,
+                subcategory=subcategory,
+                path=reverse('product', args=[subcategory.category.slug, subcategory.slug, slug]),
+                views=int(self.random.paretovariate(1.2) * 10),
+            ))
+        self.bulk_create(Product, products)
+        # Most popular first, so skewed() favours a random subset of the catalog.
+        self.random.shuffle(products)
+        return products
+
+    def placeholder_images(self):
+        from PIL import Image
+
+        directory = os.path.join(settings.MEDIA_ROOT, 'product_images', 'generated')
+        os.makedirs(directory, exist_ok=True)
+        names = []
+        for number, color in enumerate(PLACEHOLDER_COLORS):
+            name = f'placeholder-{number}.png'
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                Image.new('RGB', (300, 300), color).save(path)
+            names.append(f'product_images/generated/{name}')
+        return names
+
+    def create_articles(self, subcategories, products, count):
+        first_id = self.next_id(Article)
+        articles, links = [], []
+        with auto_now_add_disabled(Article, 'date_posted'):
+            for pk in range(first_id, first_id + count):
+                title, slug = self.title(4)
+                slug = f'{slug}-{pk}'
+                articles.append(Article(id=pk, title=f'{title} {pk}', slug=slug, text=TEXT * 5,
+                                        subject=self.random.choice(subcategories),
+                                        date_posted=self.random_date(),
+                                        path=reverse('article', args=[slug])))
+                linked = {self.skewed(products, self.product_weights).id for _ in range(ARTICLE_PRODUCTS)}
+                links.extend(Article.products.through(article_id=pk, product_id=product_id)
+                             for product_id in linked)
+            self.bulk_create(Article, articles)
+        self.bulk_create(Article.products.through, links)
+
+    def create_users(self, count):
+        first_id = self.next_id(User)
+        password = make_password('password')
+        users = [
+            User(id=pk, email=f'user{pk}@example.com', password=password)
+            for pk in range(first_id, first_id + count)
+        ]
+        self.bulk_create(User, users)
+        return users
+
+    def create_feedback(self, products, count):
+        def feedback():
+            for _ in range(count):
+                product = self.skewed(products, self.product_weights)
+                # Ratings lean towards 4 and 5 like real reviews do.
+                rating = self.random.choices((5, 4, 3, 2, 1), weights=(45, 30, 12, 6, 7))[0]
+                yield Feedback(name=self.random.choice(NAMES), text=TEXT[:self.random.randrange(20, 200)],
+                               rating=rating, product=product)
+
+        self.bulk_create(Feedback, feedback())
+        ratings = Feedback.objects.filter(product=OuterRef('pk')). \
+            values('product').annotate(rating=Avg('rating')).values('rating')
+        self.step('product ratings', lambda: Product.objects.update(rating=Subquery(ratings)))
+
+    def create_orders(self, users, products, count):
+        first_id = self.next_id(Order, ArchivedOrder)
+        line_ids = itertools.count(self.next_id(OrderProducts, ArchivedOrderProducts))
+        orders, lines = [], []
+        with auto_now_add_disabled(Order, 'date_created'):
+            for pk in range(first_id, first_id + count):
+                customer = self.skewed(users, self.user_weights)
+                orders.append(Order(id=pk, customer=customer, date_created=self.random_date()))
+                picked = {self.skewed(products, self.product_weights)
+                          for _ in range(self.random.randint(1, MAX_ORDER_LINES))}
+                lines.extend(OrderProducts(id=next(line_ids), order_id=pk, product=product, price=product.price,
+                                           quantity=self.random.choices((1, 2, 3), weights=(80, 15, 5))[0])
+                             for product in picked)
+            self.bulk_create(Order, orders)
+        self.bulk_create(OrderProducts, lines)
+
+    def reset_sequences(self):
+        models = [Category, Subcategory, Product, Article, User, Feedback, Order, OrderProducts]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+    def rebuild_rollups(self):
+        start = (self.now - timedelta(days=self.days)).date()
+        end = timezone.localdate(self.now)
+        for model in (DailyProductSales, DailyCategorySales):
+            model.rebuild(start, end)
+
+
+def popularity(count):
+    # Zipf-like cumulative weights: the first items are picked far more
+    # often than the last.
+    return list(itertools.accumulate(1 / (rank ** 1.1) for rank in range(1, count + 1)))
+
+
+@contextlib.contextmanager
+def auto_now_add_disabled(model, field_name):
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
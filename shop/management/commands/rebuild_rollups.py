@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.models import ArchivedOrder, DailyCategorySales, DailyProductSales, Order
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily sales rollups from order history over a date range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help='First day (YYYY-MM-DD), defaults to the first order.')
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help='Last day (YYYY-MM-DD), defaults to today.')
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or self.first_day() or end
+        if start > end:
+            raise CommandError('--start must not be later than --end')
+
+        for model in (DailyProductSales, DailyCategorySales):
+            model.rebuild(start, end)
+            rows = model.objects.filter(day__range=(start, end)).count()
+            self.stdout.write(f'{model._meta.db_table}: {rows} rows for {start} — {end}')
+
+    @staticmethod
+    def first_day():
+        firsts = [model.objects.order_by('date_created').values_list('date_created', flat=True).first()
+                  for model in (ArchivedOrder, Order)]
+        firsts = [first for first in firsts if first]
+        return timezone.localdate(min(firsts)) if firsts else None
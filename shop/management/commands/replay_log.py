@@ -0,0 +1,307 @@
+import ipaddress
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve, reverse
+
+from shop.forms import ProductFilterForm
+from shop.models import Category, Product, Subcategory, User
+
+Step = namedtuple('Step', 'offset method path data xhr')
+
+# Combined log format; a session is a client address and user agent.
+COMBINED = re.compile(
+    r'^(?P<address>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+)[^"]*" '
+    r'\d{3} \S+(?: "[^"]*" "(?P<agent>[^"]*)")?'
+)
+COMBINED_TIME = '%d/%b/%Y:%H:%M:%S %z'
+# Endpoints that only answer to the page's JavaScript.
+XHR_URL_NAMES = {'cart-add'}
+SAFE_METHODS = {'GET', 'HEAD'}
+# GET endpoints that change data on the server.
+WRITE_URL_NAMES = {'cart-add'}
+PERCENTILES = (50, 95, 99)
+
+
+class NoRedirect(HTTPRedirectHandler):
+    # Every request is measured on its own; logged traffic contains the
+    # request that followed the redirect.
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def url_name(path):
+    try:
+        return resolve(urlsplit(path).path).url_name or 'unnamed'
+    except Resolver404:
+        return 'unresolved'
+
+
+def is_local(host):
+    if host == 'localhost' or host.endswith('.localhost'):
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def percentile(values, percent):
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Replay an access log, or a synthetic traffic mix built from the catalog, against a running '
+            'server and report throughput, latency percentiles and errors per URL name as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--log',
+                            help='JSON lines ({"time", "session", "method", "path", "data", "xhr"}) '
+                                 'or the combined log format. Without it, a synthetic mix is replayed.')
+        parser.add_argument('--sessions', type=int, default=200,
+                            help='Sessions in the synthetic mix.')
+        parser.add_argument('--checkout-share', type=float, default=0.05,
+                            help='Share of synthetic sessions that log in and place an order (with --allow-writes).')
+        parser.add_argument('--password', default='password',
+                            help='Password of the users with @example.com emails (see generate_catalog).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Sessions replayed at the same time.')
+        parser.add_argument('--speed', type=float, default=0,
+                            help='Replay the recorded pauses this many times faster; 0 sends without pauses.')
+        parser.add_argument('--think', type=float, default=1,
+                            help='Seconds between the requests of a synthetic session.')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', help='Write the report here instead of stdout.')
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='Send requests that change data: cart additions, reviews and orders. '
+                                 'Also required for a server that is not on this machine.')
+
+    def handle(self, *args, **options):
+        self.base_url = options['base_url'].rstrip('/')
+        self.speed = options['speed']
+        self.timeout = options['timeout']
+        self.random = random.Random(options['seed'])
+        self.allow_writes = options['allow_writes']
+
+        host = urlsplit(self.base_url).hostname or ''
+        if not self.allow_writes and not is_local(host):
+            raise CommandError(f'{host} is not this machine; pass --allow-writes to load it anyway')
+
+        self.skipped_writes = 0
+        if options['log']:
+            sessions = self.read_log(options['log'])
+        else:
+            sessions = self.synthetic_sessions(options['sessions'], options['checkout_share'], options['think'],
+                                               options['password'])
+        if not sessions:
+            raise CommandError('Nothing to replay')
+
+        self.results = []
+        self.started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for _ in executor.map(self.replay_session, sessions):
+                pass
+        duration = time.monotonic() - self.started
+
+        report = self.report(duration, options)
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def read_log(self, path):
+        sessions = defaultdict(list)
+        skipped = (settings.STATIC_URL, settings.MEDIA_URL)
+
+        with open(path, encoding='utf-8') as fh:
+            for number, line in enumerate(fh, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('{'):
+                    entry = json.loads(line)
+                    session = entry.get('session') or f'line {number}'
+                    timestamp = float(entry.get('time', 0))
+                    step = Step(timestamp, entry.get('method', 'GET').upper(), entry['path'],
+                                entry.get('data'), entry.get('xhr'))
+                elif match := COMBINED.match(line):
+                    session = (match['address'], match['agent'])
+                    timestamp = datetime.strptime(match['time'], COMBINED_TIME).timestamp()
+                    step = Step(timestamp, match['method'], match['path'], None, None)
+                else:
+                    raise CommandError(f'{path}:{number}: unknown log format')
+
+                if step.path.startswith(skipped):
+                    continue
+                if self.is_write(step) and not self.allow_writes:
+                    self.skipped_writes += 1
+                    continue
+                sessions[session].append(step)
+
+        if not sessions:
+            return []
+        first = min(step.offset for steps in sessions.values() for step in steps)
+        return [
+            [step._replace(offset=step.offset - first) for step in sorted(steps, key=lambda step: step.offset)]
+            for steps in sessions.values()
+        ]
+
+    def synthetic_sessions(self, count, checkout_share, think, password):
+        products = list(Product.objects.values_list('id', 'path', 'title', 'subcategory_id', 'views'))
+        if not products:
+            raise CommandError('The catalog is empty; run generate_catalog first')
+        product_paths = {product_id: path for product_id, path, *_ in products}
+        weights = [views + 1 for *_, views in products]
+        subcategories = dict(Subcategory.objects.values_list('id', 'path'))
+        subcategory_parents = dict(Subcategory.objects.values_list('id', 'category_id'))
+        categories = dict(Category.objects.values_list('id', 'path'))
+        customers = list(User.objects.filter(email__endswith='@example.com').values_list('email', flat=True)[:1000])
+        sessions = []
+
+        for _ in range(count):
+            steps = []
+
+            def visit(path, method='GET', data=None, xhr=False):
+                steps.append(Step(len(steps) * think, method, path, data, xhr))
+
+            product_id, path, title, subcategory_id, _ = self.random.choices(products, weights)[0]
+            if self.random.random() < 0.5:
+                visit('/')
+                visit(categories[subcategory_parents[subcategory_id]])
+                visit(subcategories[subcategory_id])
+                if self.random.random() < 0.3:
+                    sort = self.random.choice(ProductFilterForm.SORTING)[0]
+                    visit(subcategories[subcategory_id] + '?' + urlencode({'sort': sort}))
+            if self.random.random() < 0.2:
+                visit(reverse('suggestions') + '?' + urlencode({'q': title[:3]}))
+
+            viewed = [product_id]
+            viewed += [choice[0] for choice in self.random.choices(products, weights, k=self.random.randint(0, 3))]
+            for viewed_id in viewed:
+                visit(product_paths[viewed_id])
+                visit(reverse('product-fragment', args=[viewed_id]))
+
+            if self.allow_writes and self.random.random() < 0.02:
+                visit(path, 'POST', {'name': 'Тест', 'text': 'Нагрузочный тест', 'rating': 5,
+                                     'product': product_id})
+
+            checkout = self.allow_writes and customers and self.random.random() < checkout_share
+            if checkout or self.random.random() < 0.3:
+                if self.allow_writes:
+                    visit(reverse('cart-add', args=[viewed[-1]]), xhr=True)
+                visit(reverse('cart'))
+                if checkout:
+                    visit(reverse('login'))
+                    visit(reverse('login'), 'POST', {'username': self.random.choice(customers),
+                                                     'password': password})
+                    visit(reverse('cart'))
+                    visit(reverse('new-order'), 'POST', {'idempotency_key': str(uuid.uuid4())})
+
+            sessions.append(steps)
+        return sessions
+
+    @staticmethod
+    def is_write(step):
+        return step.method not in SAFE_METHODS or url_name(step.path) in WRITE_URL_NAMES
+
+    def replay_session(self, steps):
+        jar = CookieJar()
+        opener = build_opener(HTTPCookieProcessor(jar), NoRedirect)
+
+        # Pauses within a session are kept even when the session starts
+        # late because all workers were busy.
+        begin = max(self.started + steps[0].offset / self.speed, time.monotonic()) if self.speed else 0
+
+        for step in steps:
+            if self.speed:
+                delay = begin + (step.offset - steps[0].offset) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            name = url_name(step.path)
+            if step.method == 'POST' and not self.csrf_token(jar):
+                # Logged posts come after a page that set the CSRF cookie.
+                self.send(opener, jar, Step(0, 'GET', reverse('login'), None, False))
+            started = time.perf_counter()
+            status = self.send(opener, jar, step, xhr=step.xhr or name in XHR_URL_NAMES)
+            self.results.append((name, status, time.perf_counter() - started))
+
+    @staticmethod
+    def csrf_token(jar):
+        return next((cookie.value for cookie in jar if cookie.name == settings.CSRF_COOKIE_NAME), None)
+
+    def send(self, opener, jar, step, xhr=False):
+        headers = {'Accept-Encoding': 'gzip, br', 'User-Agent': 'replay_log'}
+        body = None
+        if xhr:
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+        if step.method == 'POST':
+            body = urlencode(step.data or {}).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.csrf_token(jar) or ''
+
+        request = Request(self.base_url + step.path, data=body, headers=headers, method=step.method)
+        try:
+            with opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            error.read()
+            error.close()
+            return error.code
+        except (URLError, OSError):
+            return None
+
+    def report(self, duration, options):
+        by_name = defaultdict(list)
+        for name, status, elapsed in self.results:
+            by_name[name].append((status, elapsed))
+
+        def summary(results):
+            latencies = sorted(elapsed * 1000 for _, elapsed in results)
+            statuses = Counter(str(status) for status, _ in results)
+            errors = sum(count for status, count in statuses.items() if self.is_error(status))
+            return {
+                'requests': len(results),
+                'errors': errors,
+                'error_rate': round(errors / len(results), 4),
+                'throttled': statuses.get('429', 0),
+                'statuses': dict(sorted(statuses.items())),
+                'mean_ms': round(sum(latencies) / len(latencies), 2),
+                **{f'p{percent}_ms': round(percentile(latencies, percent), 2) for percent in PERCENTILES},
+            }
+
+        return {
+            'base_url': self.base_url,
+            'source': options['log'] or 'synthetic',
+            'concurrency': options['concurrency'],
+            'speed': self.speed,
+            'skipped_writes': self.skipped_writes,
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(self.results) / duration, 2) if duration else None,
+            'total': summary([(status, elapsed) for _, status, elapsed in self.results]),
+            'url_names': {name: summary(results) for name, results in sorted(by_name.items())},
+        }
+
+    @staticmethod
+    def is_error(status):
+        # Throttled requests are reported separately: a single load
+        # generator shares the limits of one client address.
+        return status == 'None' or (int(status) >= 400 and status != '429')
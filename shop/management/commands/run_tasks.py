@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from shop import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run background tasks from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of threads executing tasks.')
+        parser.add_argument('--visibility-timeout', type=int, default=settings.TASK_VISIBILITY_TIMEOUT,
+                            help='Seconds before a claimed but unfinished task is handed out again.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit as soon as the queue is drained.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        running = set()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                free = workers - len(running)
+                claimed = tasks.claim(free, options['visibility_timeout']) if free else []
+
+                for task in claimed:
+                    running.add(executor.submit(self.run_task, task))
+
+                if running:
+                    _, running = wait(running, timeout=options['poll_interval'],
+                                      return_when=FIRST_COMPLETED)
+                    running = set(running)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+
+    def run_task(self, task):
+        try:
+            started = time.perf_counter()
+            succeeded = tasks.run(task)
+            elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            connection.close()
+
+        status = self.style.SUCCESS('done') if succeeded else self.style.ERROR('failed')
+        self.stdout.write(f'{task.id} {task.name} {status} {elapsed:.1f} ms')
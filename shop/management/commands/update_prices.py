@@ -0,0 +1,61 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Set product prices from a CSV file with "id" and "price" columns. '
+            'All prices change in one transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, "-" for stdin.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products updated per statement.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the file without changing prices.')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            prices = self.read_prices(sys.stdin)
+        else:
+            try:
+                with open(options['path'], newline='', encoding='utf-8-sig') as fh:
+                    prices = self.read_prices(fh)
+            except OSError as error:
+                raise CommandError(error)
+
+        ids = list(prices)
+        batch_size = options['batch_size']
+        unknown = set(ids)
+        for start in range(0, len(ids), batch_size):
+            unknown -= set(Product.objects.filter(id__in=ids[start:start + batch_size]).values_list('id', flat=True))
+        if unknown:
+            self.stderr.write(f'Unknown products skipped: {", ".join(map(str, sorted(unknown)))}')
+            for product_id in unknown:
+                del prices[product_id]
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(prices)} prices are valid')
+            return
+
+        changed = Product.set_prices(prices, batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Done, {changed} prices changed'))
+
+    def read_prices(self, fh):
+        reader = csv.DictReader(fh)
+        if not {'id', 'price'} <= set(reader.fieldnames or ()):
+            raise CommandError('The file must have "id" and "price" columns')
+
+        prices = {}
+        for row in reader:
+            try:
+                product_id, price = int(row['id']), int(row['price'])
+            except (TypeError, ValueError):
+                raise CommandError(f'Line {reader.line_num}: invalid id or price')
+            if price < 0:
+                raise CommandError(f'Line {reader.line_num}: negative price')
+            prices[product_id] = price
+        return prices
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.models import ProductRanking
+
+
+class Command(BaseCommand):
+    help = 'Recompute the popular products ranking from view counters and recent orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=settings.POPULAR_PRODUCTS_SIZE)
+        parser.add_argument('--days', type=int, default=settings.POPULAR_PRODUCTS_DAYS)
+        parser.add_argument('--sale-weight', type=int, default=settings.POPULAR_PRODUCTS_SALE_WEIGHT,
+                            help='How many views one sold unit is worth.')
+
+    def handle(self, *args, **options):
+        rankings = ProductRanking.recompute(options['size'], options['days'], options['sale_weight'])
+        self.stdout.write(self.style.SUCCESS(f'Ranked {len(rankings)} products'))
@@ -0,0 +1,164 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client
+from django.utils import timezone
+
+from shop.models import Article, Category, OrderProducts, Product, Subcategory
+from shop.views import ProductList
+from shop.warmup import WARMUP_USER_AGENT
+
+
+# Backends that keep entries in the memory of this process, where no
+# server worker will ever read them.
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class RateLimiter:
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+
+class Command(BaseCommand):
+    help = ('Render catalog pages after a deploy so that the shared cache is filled '
+            'before the first visitors arrive. Pages are requested in order: home, '
+            'categories, subcategories, product list pages, products, articles; '
+            'within each group the most ordered items come first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of threads rendering pages.')
+        parser.add_argument('--rate', type=float, default=20,
+                            help='Maximum requests per second, 0 for no limit.')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Window of recent orders used to prioritize pages.')
+        parser.add_argument('--pages', type=int, default=1,
+                            help='Number of product list pages warmed per subcategory.')
+        parser.add_argument('--host', default=None,
+                            help='Host header of the warming requests.')
+
+    def handle(self, *args, **options):
+        local = [alias for alias in settings.CACHES if isinstance(caches[alias], PROCESS_LOCAL_CACHES)]
+        if local:
+            raise CommandError(f'The {", ".join(local)} cache is local to this process, so warming it would '
+                               f'not help the server; configure a shared cache backend first.')
+
+        urls = self.get_urls(options['days'], options['pages'])
+        self.limiter = RateLimiter(options['rate'])
+        self.host = options['host'] or self.default_host()
+        self.local = threading.local()
+        self.output_lock = threading.Lock()
+
+        started = time.monotonic()
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(self.warm_in_thread, urls))
+        else:
+            results = [self.warm(url) for url in urls]
+        elapsed = time.monotonic() - started
+
+        self.report(results, elapsed)
+
+    @staticmethod
+    def default_host():
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+        return hosts[0] if hosts else 'localhost'
+
+    def get_urls(self, days, pages):
+        since = timezone.now() - timedelta(days=days)
+        sales = OrderProducts.objects. \
+            filter(order__date_created__gte=since). \
+            values('product'). \
+            annotate(units=Sum('quantity'))
+        product_weight = {row['product']: row['units'] for row in sales}
+
+        products = list(Product.objects.values_list('id', 'path', 'subcategory_id', 'category_id'))
+        subcategory_weight, category_weight, subcategory_size = {}, {}, {}
+        for product_id, _, subcategory_id, category_id in products:
+            weight = product_weight.get(product_id, 0)
+            subcategory_weight[subcategory_id] = subcategory_weight.get(subcategory_id, 0) + weight
+            category_weight[category_id] = category_weight.get(category_id, 0) + weight
+            subcategory_size[subcategory_id] = subcategory_size.get(subcategory_id, 0) + 1
+
+        def by_weight(rows, weights):
+            return sorted(rows, key=lambda row: -weights.get(row[0], 0))
+
+        categories = by_weight(Category.objects.values_list('id', 'path'), category_weight)
+        subcategories = by_weight(Subcategory.objects.values_list('id', 'path'), subcategory_weight)
+        product_lists = []
+        for subcategory_id, path in subcategories:
+            page_count = -(-subcategory_size.get(subcategory_id, 0) // ProductList.paginate_by)
+            product_lists.append(path)
+            product_lists.extend(f'{path}?page={page}' for page in range(2, min(pages, page_count) + 1))
+        products = by_weight([(pk, path) for pk, path, _, _ in products], product_weight)
+        articles = Article.objects.order_by('-date_posted').values_list('path', flat=True)
+
+        return [
+            '/',
+            *(path for _, path in categories),
+            *product_lists,
+            *(path for _, path in products),
+            *articles,
+        ]
+
+    def warm_in_thread(self, url):
+        try:
+            return self.warm(url)
+        finally:
+            connection.close()
+
+    def warm(self, url):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client(HTTP_HOST=self.host, HTTP_USER_AGENT=WARMUP_USER_AGENT)
+
+        self.limiter.wait()
+        started = time.perf_counter()
+        response = self.local.client.get(url)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        with self.output_lock:
+            self.stdout.write(f'{response.status_code} {elapsed:8.1f} ms  {url}')
+        return url, response.status_code, elapsed
+
+    def report(self, results, elapsed):
+        timings = [ms for _, _, ms in results]
+        errors = [(url, status) for url, status, _ in results if status >= 400]
+
+        self.stdout.write('')
+        self.stdout.write(f'Warmed {len(results)} pages in {elapsed:.1f} s')
+        if timings:
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f'mean {statistics.mean(timings):.1f} ms, '
+                              f'median {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms')
+
+        for url, status in errors:
+            self.stderr.write(f'{status} {url}')
+
+        if errors:
+            self.stdout.write(self.style.WARNING(f'{len(errors)} pages failed'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All pages rendered'))
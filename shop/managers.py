@@ -1,4 +1,5 @@
 from django.contrib.auth.models import BaseUserManager
+from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -22,3 +23,20 @@ class UserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError(_('Superuser must have is_superuser=True.'))
         return self.create_user(email, password, **extra_fields)
+
+
+class ProductQuerySet(models.QuerySet):
+    LINK_FIELDS = ('id', 'title', 'price', 'path')
+    LISTING_FIELDS = (*LINK_FIELDS, 'image')
+    DETAIL_FIELDS = (*LISTING_FIELDS, 'slug', 'description')
+    # The cart shows the description truncated to 100 characters.
+    CART_SUMMARY_LENGTH = 101
+
+    def for_listing(self):
+        return self.only(*self.LISTING_FIELDS)
+
+    def for_detail(self):
+        return self.only(*self.DETAIL_FIELDS)
+
+    def for_links(self):
+        return self.only(*self.LINK_FIELDS)
@@ -0,0 +1,177 @@
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache.backends import locmem, memcached
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by URL name, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name.'),
+    'db_queries_total': ('counter', 'Database queries by URL name.'),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in database queries by URL name.'),
+    'session_writes_total': ('counter', 'Requests that saved the session.'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result.'),
+    'shop_cart_additions_total': ('counter', 'Products added to carts.'),
+    'shop_checkouts_total': ('counter', 'Placed orders.'),
+    'throttled_requests_total': ('counter', 'Requests rejected with 429 by throttle scope.'),
+}
+
+
+class Registry:
+    # Every process keeps its own totals in memory and dumps them to its
+    # own file in METRICS_DIR; the endpoint sums the files of all processes.
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.filename = f'{self.pid}-{uuid.uuid4().hex[:8]}.json'
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.last_flush = time.monotonic()
+
+    def check_fork(self):
+        # A forked worker must not report the totals of its parent.
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.check_fork()
+            self.counters[name, tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            self.check_fork()
+            key = name, tuple(sorted(labels.items()))
+            if key not in self.histograms:
+                self.histograms[key] = [0] * len(BUCKETS) + [0.0]
+            histogram = self.histograms[key]
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-1] += value
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.check_fork()
+            self.last_flush = time.monotonic()
+            state = {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, values] for (name, labels), values in self.histograms.items()],
+            }
+
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            path = os.path.join(settings.METRICS_DIR, self.filename)
+            with open(f'{path}.tmp', 'w') as fh:
+                json.dump(state, fh)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            logger.exception('Could not write metrics')
+
+    def collect(self):
+        self.flush()
+        counters = defaultdict(float)
+        histograms = {}
+
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path) as fh:
+                    state = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in state['counters']:
+                counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, values in state['histograms']:
+                key = name, tuple(map(tuple, labels))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+                else:
+                    histograms[key] = values
+
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.collect()
+        lines = []
+
+        for name, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value:g}')
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric == name:
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, values):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else f'{bound:g}'
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {values[-1]:g}')
+                    lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = Registry(flush_interval=settings.METRICS_FLUSH_INTERVAL)
+atexit.register(registry.flush)
+
+
+class InstrumentedCacheMixin:
+    # Counts hits and misses of get(); mix into any cache backend.
+
+    _missing = object()
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        if isinstance(location, (list, tuple)):
+            location = ','.join(location)
+        self.metrics_name = location or 'default'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        if value is self._missing:
+            registry.inc('cache_requests_total', cache=self.metrics_name, result='miss')
+            return default
+        registry.inc('cache_requests_total', cache=self.metrics_name, result='hit')
+        return value
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class MemcachedCache(InstrumentedCacheMixin, memcached.MemcachedCache):
+    pass
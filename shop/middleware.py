@@ -0,0 +1,188 @@
+import cProfile
+import random
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+
+from .metrics import registry
+from .models import ProfileReport
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({'sql': sql, 'time': time.perf_counter() - started})
+
+        profiler = cProfile.Profile()
+        with connection.execute_wrapper(record_query):
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = (time.perf_counter() - started) * 1000
+
+        ProfileReport.create(request, response, profiler, queries, duration)
+        return response
+
+    @staticmethod
+    def should_profile(request):
+        # Only a request that asks for a profile reaches request.user, and
+        # without a session cookie it cannot be staff: other requests never
+        # load the session for this.
+        requested = 'HTTP_X_PROFILE' in request.META or 'profile' in request.GET
+        if requested and settings.SESSION_COOKIE_NAME in request.COOKIES and request.user.is_staff:
+            return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        registry.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+        registry.observe('http_request_duration_seconds', duration, view=view)
+        if queries[0]:
+            registry.inc('db_queries_total', queries[0], view=view)
+            registry.inc('db_query_duration_seconds_total', queries[1], view=view)
+        session = getattr(request, 'session', None)
+        if session is not None and session.modified:
+            registry.inc('session_writes_total')
+        registry.maybe_flush()
+        return response
+
+
+def gzip_compress(content):
+    compressor = zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(content) + compressor.flush()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # Flush every chunk so the client gets it without waiting for the rest.
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotli_compress(content):
+    return brotli.compress(content, quality=settings.BROTLI_QUALITY)
+
+
+def brotli_stream(chunks):
+    compressor = brotli.Compressor(quality=settings.BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+# In order of preference; brotli is used only when it is installed.
+CODECS = {
+    **({'br': (brotli_compress, brotli_stream)} if brotli else {}),
+    'gzip': (gzip_compress, gzip_stream),
+}
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        name, *params = (value.strip() for value in part.split(';'))
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+class CompressionMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if not self.compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = next((name for name in CODECS if name in accepted or '*' in accepted), None)
+        if encoding is None:
+            return response
+        compress, stream = CODECS[encoding]
+
+        if response.streaming:
+            response.streaming_content = stream(response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = compress(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # The compressed body differs byte for byte, so a strong ETag must go.
+        if response.has_header('ETag') and response['ETag'].startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+        response['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def compressible(response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in settings.COMPRESSIBLE_CONTENT_TYPES and not content_type.startswith('text/'):
+            return False
+        return response.streaming or len(response.content) >= settings.COMPRESSION_MIN_LENGTH
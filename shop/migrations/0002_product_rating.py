@@ -0,0 +1,40 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:01
+
+from django.db import migrations, models
+from django.db.models import Avg, OuterRef, Subquery
+
+
+def fill_rating(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Feedback = apps.get_model('shop', 'Feedback')
+    ratings = Feedback.objects.filter(product=OuterRef('pk')). \
+        values('product').annotate(rating=Avg('rating')).values('rating')
+    Product.objects.update(rating=Subquery(ratings))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='средняя оценка'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', 'title'], name='product_subcategory_title'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', 'price'], name='product_subcategory_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', 'rating'], name='product_subcategory_rating'),
+        ),
+        migrations.RunPython(fill_rating, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+from django.urls import reverse
+
+
+def fill_paths(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    Subcategory = apps.get_model('shop', 'Subcategory')
+    Product = apps.get_model('shop', 'Product')
+    Article = apps.get_model('shop', 'Article')
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = reverse('category', args=[category.slug])
+    Category.objects.bulk_update(categories, ['path'])
+
+    subcategories = list(Subcategory.objects.select_related('category'))
+    for subcategory in subcategories:
+        subcategory.path = reverse('subcategory', args=[subcategory.category.slug, subcategory.slug])
+    Subcategory.objects.bulk_update(subcategories, ['path'])
+
+    products = list(Product.objects.select_related('category', 'subcategory'))
+    for product in products:
+        product.path = reverse('product', args=[product.category.slug, product.subcategory.slug, product.slug])
+    Product.objects.bulk_update(products, ['path'], batch_size=500)
+
+    articles = list(Article.objects.all())
+    for article in articles:
+        article.path = reverse('article', args=[article.slug])
+    Article.objects.bulk_update(articles, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='адрес страницы'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='адрес страницы'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='адрес страницы'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='адрес страницы'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
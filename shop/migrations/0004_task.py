@@ -0,0 +1,39 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='задача')),
+                ('arguments', models.TextField(default='[]', verbose_name='аргументы')),
+                ('status', models.CharField(choices=[('pending', 'в очереди'), ('running', 'выполняется'), ('done', 'выполнена'), ('failed', 'ошибка')], default='pending', max_length=10, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='максимум попыток')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='запустить после')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='заблокирована до')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='завершена')),
+            ],
+            options={
+                'verbose_name': 'фоновая задача',
+                'verbose_name_plural': 'фоновые задачи',
+                'db_table': 'tasks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'run_after'], name='task_status_run_after'),
+        ),
+    ]
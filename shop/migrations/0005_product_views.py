@@ -0,0 +1,35 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='views',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='просмотров'),
+        ),
+        migrations.CreateModel(
+            name='ProductRanking',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(db_index=True, verbose_name='место')),
+                ('views', models.PositiveIntegerField(verbose_name='просмотров')),
+                ('units_sold', models.PositiveIntegerField(verbose_name='продано')),
+                ('score', models.PositiveIntegerField(verbose_name='рейтинг популярности')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ranking', to='shop.Product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'популярный товар',
+                'verbose_name_plural': 'популярные товары',
+                'db_table': 'productrankings',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_views'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproducts',
+            name='price',
+            field=models.IntegerField(null=True, verbose_name='цена на момент заказа'),
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='продано единиц')),
+                ('revenue', models.BigIntegerField(default=0, verbose_name='выручка')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='заказов')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.Product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'продажи товара за день',
+                'verbose_name_plural': 'продажи товаров по дням',
+                'db_table': 'dailyproductsales',
+                'unique_together': {('day', 'product')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='продано единиц')),
+                ('revenue', models.BigIntegerField(default=0, verbose_name='выручка')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='заказов')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.Category', verbose_name='раздел')),
+            ],
+            options={
+                'verbose_name': 'продажи раздела за день',
+                'verbose_name_plural': 'аналитика продаж',
+                'db_table': 'dailycategorysales',
+                'unique_together': {('day', 'category')},
+            },
+        ),
+    ]
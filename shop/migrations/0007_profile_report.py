@@ -0,0 +1,36 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='создан')),
+                ('method', models.CharField(max_length=10, verbose_name='метод')),
+                ('path', models.CharField(max_length=255, verbose_name='адрес')),
+                ('url_name', models.CharField(blank=True, max_length=100, verbose_name='имя маршрута')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='код ответа')),
+                ('duration', models.FloatField(verbose_name='время, мс')),
+                ('query_count', models.PositiveIntegerField(verbose_name='SQL-запросов')),
+                ('query_time', models.FloatField(verbose_name='время SQL, мс')),
+                ('sql_summary', models.TextField(verbose_name='сводка SQL')),
+                ('stats_summary', models.TextField(verbose_name='сводка профиля')),
+                ('filename', models.CharField(max_length=100, verbose_name='файл профиля')),
+            ],
+            options={
+                'verbose_name': 'профиль запроса',
+                'verbose_name_plural': 'профили запросов',
+                'db_table': 'profilereports',
+                'ordering': ['-date_created'],
+            },
+        ),
+    ]
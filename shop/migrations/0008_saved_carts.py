@@ -0,0 +1,44 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_profile_report'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedCart',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(blank=True, max_length=32, null=True, unique=True, verbose_name='токен анонимной корзины')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='дата изменения')),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='saved_cart', to=settings.AUTH_USER_MODEL, verbose_name='покупатель')),
+            ],
+            options={
+                'verbose_name': 'корзина',
+                'verbose_name_plural': 'корзины',
+                'db_table': 'carts',
+            },
+        ),
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='количество')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.SavedCart', verbose_name='корзина')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shop.Product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'товар в корзине',
+                'verbose_name_plural': 'товары в корзине',
+                'db_table': 'cartlines',
+                'unique_together': {('cart', 'product')},
+            },
+        ),
+    ]
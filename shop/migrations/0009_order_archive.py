@@ -0,0 +1,44 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_saved_carts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='номер заказа')),
+                ('date_created', models.DateTimeField(verbose_name='дата заказа')),
+                ('date_archived', models.DateTimeField(verbose_name='дата архивации')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='покупатель')),
+            ],
+            options={
+                'verbose_name': 'архивный заказ',
+                'verbose_name_plural': 'архивные заказы',
+                'db_table': 'archivedorders',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderProducts',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField(verbose_name='количество товара')),
+                ('price', models.IntegerField(null=True, verbose_name='цена на момент заказа')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='orderproducts', to='shop.ArchivedOrder', verbose_name='заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='shop.Product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'состав архивного заказа',
+                'verbose_name_plural': 'состав архивного заказа',
+                'db_table': 'archivedorderproducts',
+            },
+        ),
+    ]
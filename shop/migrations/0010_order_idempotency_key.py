@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.UUIDField(editable=False, null=True, unique=True, verbose_name='ключ идемпотентности'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.7 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogGeneration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True, verbose_name='название')),
+                ('value', models.BigIntegerField(verbose_name='поколение')),
+            ],
+            options={
+                'verbose_name': 'поколение каталога',
+                'verbose_name_plural': 'поколения каталога',
+                'db_table': 'cataloggenerations',
+            },
+        ),
+    ]
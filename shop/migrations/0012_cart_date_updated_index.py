@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-19 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_catalog_generation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='savedcart',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='дата изменения'),
+        ),
+    ]
@@ -1,9 +1,50 @@
+import io
+import os
+import pstats
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
 from django.shortcuts import reverse
+from django.utils import timezone
+
+from shop.cache import FEEDS_GENERATION, bump_catalog_generation, bump_generation
+from shop.managers import ProductQuerySet, UserManager
+from shop.purge import purge
+
+
+def refresh_paths(queryset, batch_size=500):
+    batch = []
+    for obj in queryset.iterator(chunk_size=batch_size):
+        obj.path = obj.build_path()
+        batch.append(obj)
+        if len(batch) == batch_size:
+            queryset.model.objects.bulk_update(batch, ['path'])
+            batch = []
+    if batch:
+        queryset.model.objects.bulk_update(batch, ['path'])
+
 
-from shop.managers import UserManager
+def copy_rows(source, target, columns, key, ids, extra=None):
+    # INSERT ... SELECT keeps the rows out of Python.
+    if not ids:
+        return
+    extra = extra or {}
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(target._meta.db_table)} ({", ".join(map(quote, [*columns, *extra]))}) '
+            f'SELECT {", ".join([*map(quote, columns), *["%s"] * len(extra)])} '
+            f'FROM {quote(source._meta.db_table)} '
+            f'WHERE {quote(key)} IN ({", ".join(["%s"] * len(ids))})',
+            [*extra.values(), *ids],
+        )
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -41,21 +82,62 @@ class Order(models.Model):
     date_created = models.DateTimeField(
         auto_now_add=True,
     )
+    # Rendered into the checkout form; a repeated submit of the same form
+    # finds the order it has already placed.
+    idempotency_key = models.UUIDField(
+        null=True,
+        unique=True,
+        editable=False,
+        verbose_name='ключ идемпотентности',
+    )
 
     def __str__(self):
         return f'№ {self.id} {self.date_created.date()} {self.customer.email}'
 
     @classmethod
-    def checkout(cls, customer, cart):
-        order = cls.objects.create(customer=customer)
-        order.save()
-
-        for product, qty in cart.items():
-            OrderProducts.objects.create(
-                order=order,
-                product_id=product,
-                quantity=qty,
-            )
+    def placed(cls, customer, idempotency_key):
+        if idempotency_key is None:
+            return None
+        orders = cls.objects.filter(customer=customer, idempotency_key=idempotency_key)
+        return orders.values_list('id', flat=True).first()
+
+    @classmethod
+    def place(cls, customer, cart, idempotency_key):
+        # Returns the order id and whether it was created by this call.
+        try:
+            with transaction.atomic():
+                return cls.checkout(customer, cart, idempotency_key), True
+        except IntegrityError:
+            order_id = cls.placed(customer, idempotency_key)
+            if order_id is None:
+                raise
+            return order_id, False
+
+    @classmethod
+    def checkout(cls, customer, cart, idempotency_key=None):
+        quantities = {int(product_id): qty for product_id, qty in cart.items()}
+
+        with transaction.atomic():
+            order = cls.objects.create(customer=customer, idempotency_key=idempotency_key)
+            products = list(Product.objects.
+                            filter(id__in=quantities.keys()).
+                            values_list('id', 'price', 'category_id'))
+
+            lines = [
+                OrderProducts(order=order, product_id=product_id, quantity=quantities[product_id], price=price)
+                for product_id, price, _ in products
+            ]
+            OrderProducts.objects.bulk_create(lines)
+
+            day = timezone.localdate(order.date_created)
+            categories = {}
+            for product_id, price, category_id in products:
+                units = quantities[product_id]
+                DailyProductSales.increment(day, product_id, units, units * price)
+                category_units, category_revenue = categories.get(category_id, (0, 0))
+                categories[category_id] = (category_units + units, category_revenue + units * price)
+            for category_id, (units, revenue) in categories.items():
+                DailyCategorySales.increment(day, category_id, units, revenue)
 
         return order.id
 
@@ -80,6 +162,10 @@ class OrderProducts(models.Model):
         on_delete=models.DO_NOTHING,
         verbose_name='товар',
     )
+    price = models.IntegerField(
+        null=True,
+        verbose_name='цена на момент заказа',
+    )
 
     def __str__(self):
         return f'{self.order.id} {self.order.customer}'
@@ -124,20 +210,82 @@ class Product(models.Model):
         related_name='products',
         related_query_name='product',
     )
+    rating = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='средняя оценка',
+    )
+    path = models.CharField(
+        max_length=255,
+        editable=False,
+        verbose_name='адрес страницы',
+    )
+    views = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='просмотров',
+    )
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.title} {self.subcategory} {self.price}'
 
-    def get_absolute_url(self):
+    @classmethod
+    def set_prices(cls, prices, batch_size=500):
+        # Bulk counterpart of saving products one by one: a single
+        # transaction, so carts and checkouts see either all old or all new
+        # prices, and one invalidation for every affected page.
+        ids = list(prices)
+        paths = set()
+        changed = 0
+
+        with transaction.atomic():
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                current = cls.objects.filter(id__in=batch). \
+                    values_list('id', 'price', 'path', 'subcategory__path', 'category__path')
+                products = []
+                for product_id, price, *product_paths in current:
+                    if price != prices[product_id]:
+                        products.append(cls(id=product_id, price=prices[product_id]))
+                        paths.update(product_paths)
+                if products:
+                    cls.objects.bulk_update(products, ['price'])
+                    articles = Article.objects.filter(products__in=[product.id for product in products])
+                    paths.update(articles.values_list('path', flat=True))
+                    changed += len(products)
+
+            if changed:
+                purge([*paths, '/'])
+        if changed:
+            bump_catalog_generation()
+            bump_generation(FEEDS_GENERATION)
+        return changed
+
+    def build_path(self):
         return reverse('product',
                        args=[self.category.slug,
                              self.subcategory.slug,
                              self.slug])
 
+    def save(self, *args, **kwargs):
+        self.path = self.build_path()
+        super().save(*args, **kwargs)
+
+    def get_absolute_url(self):
+        return self.path
+
     class Meta:
         db_table = 'products'
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
+        indexes = [
+            models.Index(fields=['subcategory', 'title'], name='product_subcategory_title'),
+            models.Index(fields=['subcategory', 'price'], name='product_subcategory_price'),
+            models.Index(fields=['subcategory', 'rating'], name='product_subcategory_rating'),
+        ]
 
 
 class Category(models.Model):
@@ -149,14 +297,32 @@ class Category(models.Model):
         max_length=100,
         verbose_name='ссылка',
     )
+    path = models.CharField(
+        max_length=255,
+        editable=False,
+        verbose_name='адрес страницы',
+    )
 
     def __str__(self):
         return f'{self.title}'
 
-    def get_absolute_url(self):
+    def build_path(self):
         return reverse('category',
                        args=[self.slug])
 
+    def save(self, *args, **kwargs):
+        path = self.build_path()
+        cascade = self.pk is not None and path != self.path
+        self.path = path
+        super().save(*args, **kwargs)
+
+        if cascade:
+            refresh_paths(self.subcategories.select_related('category'))
+            refresh_paths(self.products.select_related('category', 'subcategory'))
+
+    def get_absolute_url(self):
+        return self.path
+
     class Meta:
         db_table = 'categories'
         verbose_name = 'раздел'
@@ -179,15 +345,32 @@ class Subcategory(models.Model):
         related_name='subcategories',
         related_query_name="subcategory"
     )
+    path = models.CharField(
+        max_length=255,
+        editable=False,
+        verbose_name='адрес страницы',
+    )
 
     def __str__(self):
         return f'{self.title}'
 
-    def get_absolute_url(self):
+    def build_path(self):
         return reverse('subcategory',
                        args=[self.category.slug,
                              self.slug])
 
+    def save(self, *args, **kwargs):
+        path = self.build_path()
+        cascade = self.pk is not None and path != self.path
+        self.path = path
+        super().save(*args, **kwargs)
+
+        if cascade:
+            refresh_paths(self.products.select_related('category', 'subcategory'))
+
+    def get_absolute_url(self):
+        return self.path
+
     class Meta:
         db_table = 'subcategories'
         verbose_name = 'подраздел'
@@ -220,14 +403,26 @@ class Article(models.Model):
     date_posted = models.DateTimeField(
         auto_now_add=True
     )
+    path = models.CharField(
+        max_length=255,
+        editable=False,
+        verbose_name='адрес страницы',
+    )
 
     def __str__(self):
         return f'{self.title}'
 
-    def get_absolute_url(self):
+    def build_path(self):
         return reverse('article',
                        args=[self.slug])
 
+    def save(self, *args, **kwargs):
+        self.path = self.build_path()
+        super().save(*args, **kwargs)
+
+    def get_absolute_url(self):
+        return self.path
+
     class Meta:
         db_table = 'articles'
         verbose_name = 'статья'
@@ -273,3 +468,588 @@ class Feedback(models.Model):
         db_table = 'feedbacks'
         verbose_name = 'отзыв'
         verbose_name_plural = 'отзывы'
+
+
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUSES = (
+        (PENDING, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (DONE, 'выполнена'),
+        (FAILED, 'ошибка'),
+    )
+
+    name = models.CharField(
+        max_length=200,
+        verbose_name='задача',
+    )
+    arguments = models.TextField(
+        default='[]',
+        verbose_name='аргументы',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='статус',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='попыток',
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name='максимум попыток',
+    )
+    run_after = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='запустить после',
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='заблокирована до',
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='последняя ошибка',
+    )
+    date_created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='создана',
+    )
+    date_finished = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='завершена',
+    )
+
+    def __str__(self):
+        return f'{self.name} {self.get_status_display()}'
+
+    class Meta:
+        db_table = 'tasks'
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after'),
+        ]
+
+
+class ProductRanking(models.Model):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name='товар',
+        related_name='ranking',
+    )
+    rank = models.PositiveIntegerField(
+        db_index=True,
+        verbose_name='место',
+    )
+    views = models.PositiveIntegerField(
+        verbose_name='просмотров',
+    )
+    units_sold = models.PositiveIntegerField(
+        verbose_name='продано',
+    )
+    score = models.PositiveIntegerField(
+        verbose_name='рейтинг популярности',
+    )
+
+    def __str__(self):
+        return f'{self.rank} {self.product_id}'
+
+    @classmethod
+    def recompute(cls, size, days, sale_weight):
+        since = timezone.now() - timedelta(days=days)
+        sales = OrderProducts.objects. \
+            filter(order__date_created__gte=since). \
+            values_list('product'). \
+            annotate(units=Sum('quantity'))
+        units_sold = dict(sales)
+        views = dict(Product.objects.filter(views__gt=0).values_list('id', 'views'))
+
+        scores = {
+            product_id: views.get(product_id, 0) + units_sold.get(product_id, 0) * sale_weight
+            for product_id in views.keys() | units_sold.keys()
+        }
+        top = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))[:size]
+
+        rankings = [
+            cls(product_id=product_id,
+                rank=rank,
+                views=views.get(product_id, 0),
+                units_sold=units_sold.get(product_id, 0),
+                score=scores[product_id])
+            for rank, product_id in enumerate(top, start=1)
+        ]
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rankings)
+
+        return rankings
+
+    class Meta:
+        db_table = 'productrankings'
+        verbose_name = 'популярный товар'
+        verbose_name_plural = 'популярные товары'
+
+
+class SalesRollup(models.Model):
+    source = None
+
+    day = models.DateField(
+        verbose_name='день',
+    )
+    units = models.PositiveIntegerField(
+        default=0,
+        verbose_name='продано единиц',
+    )
+    revenue = models.BigIntegerField(
+        default=0,
+        verbose_name='выручка',
+    )
+    orders = models.PositiveIntegerField(
+        default=0,
+        verbose_name='заказов',
+    )
+
+    @classmethod
+    def increment(cls, day, key, units, revenue):
+        lookup = {'day': day, f'{cls.key_field()}_id': key}
+        changes = {'units': F('units') + units, 'revenue': F('revenue') + revenue, 'orders': F('orders') + 1}
+
+        if cls.objects.filter(**lookup).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**lookup, units=units, revenue=revenue, orders=1)
+        except IntegrityError:
+            cls.objects.filter(**lookup).update(**changes)
+
+    @classmethod
+    def rebuild(cls, start, end):
+        key = cls.key_field()
+
+        with transaction.atomic():
+            cls.objects.filter(day__range=(start, end)).delete()
+            cls.objects.bulk_create(
+                (cls(day=row['day'], units=row['units'], revenue=row['revenue'], orders=row['orders'],
+                     **{f'{key}_id': row['key']})
+                 for row in cls.sales(start, end)),
+                batch_size=500,
+            )
+
+    @classmethod
+    def sales(cls, start, end):
+        # Live and archived orders; a day may have both around the cutoff.
+        def rows(model):
+            return model.objects. \
+                annotate(day=TruncDate('order__date_created')). \
+                filter(day__range=(start, end)). \
+                values('day', key=F(cls.source)). \
+                annotate(units=Sum('quantity'),
+                         revenue=Sum(F('quantity') * Coalesce('price', 'product__price')),
+                         orders=Count('order', distinct=True)). \
+                order_by()
+
+        archived = {(row['day'], row['key']): row for row in rows(ArchivedOrderProducts).iterator()}
+        for row in rows(OrderProducts).iterator():
+            if other := archived.pop((row['day'], row['key']), None):
+                for field in ('units', 'revenue', 'orders'):
+                    row[field] += other[field]
+            yield row
+        yield from archived.values()
+
+    @classmethod
+    def key_field(cls):
+        return cls.source.split('__')[-1]
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(SalesRollup):
+    source = 'product'
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name='товар',
+        related_name='+',
+    )
+
+    def __str__(self):
+        return f'{self.day} {self.product_id}'
+
+    class Meta:
+        db_table = 'dailyproductsales'
+        verbose_name = 'продажи товара за день'
+        verbose_name_plural = 'продажи товаров по дням'
+        unique_together = ('day', 'product')
+
+
+class DailyCategorySales(SalesRollup):
+    source = 'product__category'
+
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        verbose_name='раздел',
+        related_name='+',
+    )
+
+    def __str__(self):
+        return f'{self.day} {self.category_id}'
+
+    class Meta:
+        db_table = 'dailycategorysales'
+        verbose_name = 'продажи раздела за день'
+        verbose_name_plural = 'аналитика продаж'
+        unique_together = ('day', 'category')
+
+
+class ProfileReport(models.Model):
+    date_created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='создан',
+    )
+    method = models.CharField(
+        max_length=10,
+        verbose_name='метод',
+    )
+    path = models.CharField(
+        max_length=255,
+        verbose_name='адрес',
+    )
+    url_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='имя маршрута',
+    )
+    status_code = models.PositiveSmallIntegerField(
+        verbose_name='код ответа',
+    )
+    duration = models.FloatField(
+        verbose_name='время, мс',
+    )
+    query_count = models.PositiveIntegerField(
+        verbose_name='SQL-запросов',
+    )
+    query_time = models.FloatField(
+        verbose_name='время SQL, мс',
+    )
+    sql_summary = models.TextField(
+        verbose_name='сводка SQL',
+    )
+    stats_summary = models.TextField(
+        verbose_name='сводка профиля',
+    )
+    filename = models.CharField(
+        max_length=100,
+        verbose_name='файл профиля',
+    )
+
+    def __str__(self):
+        return f'{self.method} {self.path} {self.duration:.0f} мс'
+
+    @property
+    def file_path(self):
+        return os.path.join(settings.PROFILING_DIR, self.filename)
+
+    @classmethod
+    def create(cls, request, response, profiler, queries, duration):
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        filename = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.prof'
+        profiler.dump_stats(os.path.join(settings.PROFILING_DIR, filename))
+
+        stats_output = io.StringIO()
+        pstats.Stats(profiler, stream=stats_output).sort_stats('cumulative').print_stats(40)
+
+        match = request.resolver_match
+        return cls.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:255],
+            url_name=(match.url_name or '') if match else '',
+            status_code=response.status_code,
+            duration=duration,
+            query_count=len(queries),
+            query_time=sum(float(query['time']) for query in queries) * 1000,
+            sql_summary=cls.summarize_queries(queries),
+            stats_summary=stats_output.getvalue(),
+            filename=filename,
+        )
+
+    @staticmethod
+    def summarize_queries(queries, limit=10):
+        lines = ['Самые долгие запросы:']
+        for query in sorted(queries, key=lambda query: -float(query['time']))[:limit]:
+            lines.append(f'{float(query["time"]) * 1000:8.2f} мс  {query["sql"]}')
+
+        repeated = [(sql, count) for sql, count in Counter(query['sql'] for query in queries).most_common(limit)
+                    if count > 1]
+        if repeated:
+            lines.append('')
+            lines.append('Повторяющиеся запросы:')
+            lines.extend(f'{count:5d} x  {sql}' for sql, count in repeated)
+        return '\n'.join(lines)
+
+    class Meta:
+        db_table = 'profilereports'
+        verbose_name = 'профиль запроса'
+        verbose_name_plural = 'профили запросов'
+        ordering = ['-date_created']
+
+
+class SavedCart(models.Model):
+    # Named so as not to clash with shop.cart.Cart, which renders it.
+    TOKEN_SESSION_KEY = 'cart_token'
+    UPSERT_BATCH_SIZE = 300
+
+    user = models.OneToOneField(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='saved_cart',
+        verbose_name='покупатель',
+    )
+    token = models.CharField(
+        max_length=32,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name='токен анонимной корзины',
+    )
+    date_updated = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='дата изменения',
+    )
+
+    def __str__(self):
+        return self.user.email if self.user_id else self.token
+
+    @classmethod
+    def owner(cls, request):
+        if request.user.is_authenticated:
+            return {'user': request.user}
+        if token := request.session.get(cls.TOKEN_SESSION_KEY):
+            return {'token': token}
+        return None
+
+    @classmethod
+    def for_request(cls, request, create=False):
+        owner = cls.owner(request)
+        if not create:
+            return cls.objects.filter(**owner).first() if owner else None
+
+        if owner is None:
+            owner = {'token': uuid.uuid4().hex}
+            request.session[cls.TOKEN_SESSION_KEY] = owner['token']
+        return cls.objects.get_or_create(**owner)[0]
+
+    def add(self, quantities):
+        # INSERT ... ON CONFLICT works on SQLite 3.24+ and PostgreSQL.
+        rows = [(self.id, int(product_id), qty) for product_id, qty in quantities.items()]
+        table = connection.ops.quote_name(CartLine._meta.db_table)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(rows), self.UPSERT_BATCH_SIZE):
+                batch = rows[start:start + self.UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {table} (cart_id, product_id, quantity) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT (cart_id, product_id) '
+                    f'DO UPDATE SET quantity = {table}.quantity + excluded.quantity',
+                    [value for row in batch for value in row],
+                )
+            SavedCart.objects.filter(id=self.id).update(date_updated=timezone.now())
+
+    def quantities(self):
+        return dict(self.lines.values_list('product_id', 'quantity'))
+
+    def clear(self):
+        self.lines.all().delete()
+
+    @classmethod
+    def merge(cls, token, user):
+        with transaction.atomic():
+            anonymous = cls.objects.select_for_update().filter(token=token, user=None).first()
+            if anonymous is None:
+                return
+            cart, _ = cls.objects.get_or_create(user=user)
+            cart.add(anonymous.quantities())
+            anonymous.delete()
+
+    @classmethod
+    def expire(cls, cutoff, batch_size):
+        # Only anonymous carts: their token is lost with the session, while
+        # a customer's cart waits for the next login.
+        with transaction.atomic():
+            ids = list(cls.objects.
+                       filter(user=None, date_updated__lt=cutoff).
+                       order_by('id').
+                       values_list('id', flat=True)[:batch_size])
+            CartLine.objects.filter(cart_id__in=ids).delete()
+            return cls.objects.filter(id__in=ids).delete()[0]
+
+    class Meta:
+        db_table = 'carts'
+        verbose_name = 'корзина'
+        verbose_name_plural = 'корзины'
+
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(
+        SavedCart,
+        on_delete=models.CASCADE,
+        related_name='lines',
+        verbose_name='корзина',
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name='товар',
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name='количество',
+    )
+
+    def __str__(self):
+        return f'{self.product_id} {self.quantity}'
+
+    @classmethod
+    def for_owner(cls, owner):
+        return cls.objects.filter(**{f'cart__{key}': value for key, value in owner.items()})
+
+    class Meta:
+        db_table = 'cartlines'
+        verbose_name = 'товар в корзине'
+        verbose_name_plural = 'товары в корзине'
+        unique_together = [('cart', 'product')]
+
+
+class ArchivedOrder(models.Model):
+    ORDER_COLUMNS = ('id', 'customer_id', 'date_created')
+    LINE_COLUMNS = ('id', 'order_id', 'quantity', 'product_id', 'price')
+
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name='номер заказа',
+    )
+    customer = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='покупатель',
+    )
+    date_created = models.DateTimeField(
+        verbose_name='дата заказа',
+    )
+    date_archived = models.DateTimeField(
+        verbose_name='дата архивации',
+    )
+
+    def __str__(self):
+        return f'№ {self.id} {self.date_created.date()} {self.customer.email}'
+
+    @classmethod
+    def archive(cls, cutoff, batch_size):
+        # One batch per transaction: an interrupted run leaves every order
+        # either live or archived, and the next run picks up the rest.
+        with transaction.atomic():
+            ids = list(Order.objects.
+                       filter(date_created__lt=cutoff).
+                       order_by('id').
+                       values_list('id', flat=True)[:batch_size])
+            if ids:
+                copy_rows(Order, cls, cls.ORDER_COLUMNS, 'id', ids,
+                          {'date_archived': connection.ops.adapt_datetimefield_value(timezone.now())})
+                copy_rows(OrderProducts, ArchivedOrderProducts, cls.LINE_COLUMNS, 'order_id', ids)
+                OrderProducts.objects.filter(order_id__in=ids).delete()
+                Order.objects.filter(id__in=ids).delete()
+        return len(ids)
+
+    @classmethod
+    def restore(cls, ids):
+        # Returns the ids left in the archive because a live order or order
+        # line already has the same id.
+        ids = list(ids)
+        if not ids:
+            return []
+        with transaction.atomic():
+            taken = set(Order.objects.filter(id__in=ids).values_list('id', flat=True))
+            taken.update(ArchivedOrderProducts.objects.
+                         filter(order_id__in=ids, id__in=OrderProducts.objects.values('id')).
+                         values_list('order_id', flat=True))
+            ids = [order_id for order_id in ids if order_id not in taken]
+            if ids:
+                copy_rows(cls, Order, cls.ORDER_COLUMNS, 'id', ids)
+                copy_rows(ArchivedOrderProducts, OrderProducts, cls.LINE_COLUMNS, 'order_id', ids)
+                ArchivedOrderProducts.objects.filter(order_id__in=ids).delete()
+                cls.objects.filter(id__in=ids).delete()
+        return sorted(taken)
+
+    class Meta:
+        db_table = 'archivedorders'
+        verbose_name = 'архивный заказ'
+        verbose_name_plural = 'архивные заказы'
+
+
+class ArchivedOrderProducts(models.Model):
+    id = models.IntegerField(
+        primary_key=True,
+    )
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.DO_NOTHING,
+        verbose_name='заказ',
+        related_name='orderproducts'
+    )
+    quantity = models.IntegerField(
+        verbose_name='количество товара',
+    )
+    product = models.ForeignKey(
+        'Product',
+        on_delete=models.DO_NOTHING,
+        verbose_name='товар',
+    )
+    price = models.IntegerField(
+        null=True,
+        verbose_name='цена на момент заказа',
+    )
+
+    def __str__(self):
+        return f'{self.order_id} {self.product_id}'
+
+    class Meta:
+        db_table = 'archivedorderproducts'
+        verbose_name = 'состав архивного заказа'
+        verbose_name_plural = 'состав архивного заказа'
+
+
+class CatalogGeneration(models.Model):
+    # The number shop.cache puts into catalog cache keys. It lives here so
+    # that every worker sees the same value; the cache only holds a copy.
+    name = models.CharField(
+        max_length=30,
+        unique=True,
+        verbose_name='название',
+    )
+    value = models.BigIntegerField(
+        verbose_name='поколение',
+    )
+
+    def __str__(self):
+        return f'{self.name} {self.value}'
+
+    class Meta:
+        db_table = 'cataloggenerations'
+        verbose_name = 'поколение каталога'
+        verbose_name_plural = 'поколения каталога'
@@ -0,0 +1,22 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PURGE_ALL = '*'
+
+
+def purge(paths):
+    paths = sorted(set(paths))
+    if PURGE_ALL in paths:
+        paths = [PURGE_ALL]
+
+    backend = import_string(settings.CACHE_PURGE_BACKEND)
+    transaction.on_commit(lambda: backend(paths))
+
+
+def log_purge(paths):
+    logger.info('Purge %s', ' '.join(paths))
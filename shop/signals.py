@@ -0,0 +1,115 @@
+import contextlib
+import os
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models import Avg
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import FEEDS_GENERATION, TITLES_GENERATION, bump_catalog_generation, bump_generation
+from .models import Article, Category, Feedback, Product, ProfileReport, SavedCart, Subcategory
+from .purge import PURGE_ALL, purge
+
+CATALOG_MODELS = (Product, Category, Subcategory, Article, Feedback)
+TITLED_MODELS = (Product, Category, Subcategory, Article)
+
+
+def catalog_changed(sender, **kwargs):
+    bump_catalog_generation()
+
+
+def feeds_changed(sender, **kwargs):
+    bump_generation(FEEDS_GENERATION)
+
+
+def titles_changed(sender, update_fields=None, **kwargs):
+    if update_fields is None or {'title', 'path'} & set(update_fields):
+        bump_generation(TITLES_GENERATION)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=model,
+                      dispatch_uid=f'catalog_changed_save_{model.__name__}')
+    post_delete.connect(catalog_changed, sender=model,
+                        dispatch_uid=f'catalog_changed_delete_{model.__name__}')
+
+for model in TITLED_MODELS:
+    post_save.connect(feeds_changed, sender=model,
+                      dispatch_uid=f'feeds_changed_save_{model.__name__}')
+    post_delete.connect(feeds_changed, sender=model,
+                        dispatch_uid=f'feeds_changed_delete_{model.__name__}')
+    post_save.connect(titles_changed, sender=model,
+                      dispatch_uid=f'titles_changed_save_{model.__name__}')
+    post_delete.connect(titles_changed, sender=model,
+                        dispatch_uid=f'titles_changed_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=Feedback, dispatch_uid='update_product_rating_save')
+@receiver(post_delete, sender=Feedback, dispatch_uid='update_product_rating_delete')
+def update_product_rating(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    rating = Feedback.objects.filter(product_id=instance.product_id).aggregate(rating=Avg('rating'))['rating']
+    Product.objects.filter(id=instance.product_id).update(rating=rating)
+
+
+def product_paths(product):
+    return [
+        product.path,
+        *Subcategory.objects.filter(id=product.subcategory_id).values_list('path', flat=True),
+        *Category.objects.filter(id=product.category_id).values_list('path', flat=True),
+        *product.articles.values_list('path', flat=True),
+        '/',
+    ]
+
+
+@receiver(post_save, sender=Product, dispatch_uid='purge_product_save')
+@receiver(post_delete, sender=Product, dispatch_uid='purge_product_delete')
+def purge_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        purge(product_paths(instance))
+
+
+@receiver(post_save, sender=Feedback, dispatch_uid='purge_feedback_save')
+@receiver(post_delete, sender=Feedback, dispatch_uid='purge_feedback_delete')
+def purge_feedback(sender, instance, raw=False, **kwargs):
+    if not raw:
+        paths = Product.objects.filter(id=instance.product_id).values_list('path', 'subcategory__path')
+        purge([path for row in paths for path in row])
+
+
+@receiver(post_save, sender=Article, dispatch_uid='purge_article_save')
+@receiver(post_delete, sender=Article, dispatch_uid='purge_article_delete')
+def purge_article(sender, instance, raw=False, **kwargs):
+    if not raw:
+        purge([instance.path, '/'])
+
+
+@receiver(post_save, sender=Category, dispatch_uid='purge_category_save')
+@receiver(post_delete, sender=Category, dispatch_uid='purge_category_delete')
+@receiver(post_save, sender=Subcategory, dispatch_uid='purge_subcategory_save')
+@receiver(post_delete, sender=Subcategory, dispatch_uid='purge_subcategory_delete')
+def purge_navigation(sender, instance, raw=False, **kwargs):
+    # Categories and subcategories are listed in the navbar of every page.
+    if not raw:
+        purge([PURGE_ALL])
+
+
+@receiver(user_logged_in, dispatch_uid='merge_saved_cart')
+def merge_saved_cart(sender, request, user, **kwargs):
+    if request is not None and (token := request.session.pop(SavedCart.TOKEN_SESSION_KEY, None)):
+        SavedCart.merge(token, user)
+
+
+def remove_profile(path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+@receiver(post_delete, sender=ProfileReport, dispatch_uid='remove_profile_file')
+def remove_profile_file(sender, instance, **kwargs):
+    # Also sent for each report of an admin bulk delete.
+    path = instance.file_path
+    transaction.on_commit(lambda: remove_profile(path))
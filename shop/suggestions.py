@@ -0,0 +1,131 @@
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .cache import TITLES_GENERATION, generation
+from .models import Article, Category, Product, Subcategory
+
+TOKEN = re.compile(r'\w+')
+# Top completions of one- and two-letter prefixes are precomputed, since
+# those ranges cover a large part of the catalog.
+SHORT_PREFIX = 2
+MAX_LIMIT = 20
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower().replace('ё', 'е'))
+
+
+class SuggestionIndex:
+    # Sorted title tokens with a parallel array of entry numbers; a prefix
+    # is a bisect range. Entries are (weight, title, url, kind) tuples.
+
+    def __init__(self, background=True):
+        self.background = background
+        self.lock = threading.Lock()
+        # Held for the whole rebuild, so only one runs at a time.
+        self.building = threading.Lock()
+        self.generation = None
+        self.built_at = None
+        self.tokens = []
+        self.postings = array('I')
+        self.entries = []
+        self.entry_tokens = []
+        self.short_prefixes = {}
+
+    @staticmethod
+    def load():
+        yield from ((views, title, path, 'product') for title, path, views in
+                    Product.objects.values_list('title', 'path', 'views').iterator())
+        for model, kind, views in ((Category, 'category', 'product__views'),
+                                   (Subcategory, 'subcategory', 'product__views'),
+                                   (Article, 'article', 'products__views')):
+            yield from ((weight, title, path, kind) for title, path, weight in
+                        model.objects.annotate(weight=Coalesce(Sum(views), 0)).values_list('title', 'path', 'weight'))
+
+    def build(self, generation):
+        entries = list(self.load())
+        entry_tokens = [tuple(tokenize(title)) for _, title, _, _ in entries]
+        pairs = sorted((token, number) for number, tokens in enumerate(entry_tokens) for token in set(tokens))
+
+        short_prefixes = {}
+        for token, number in pairs:
+            for length in range(1, min(SHORT_PREFIX, len(token)) + 1):
+                short_prefixes.setdefault(token[:length], set()).add(number)
+        short_prefixes = {
+            prefix: heapq.nlargest(MAX_LIMIT, numbers, key=lambda number: entries[number][0])
+            for prefix, numbers in short_prefixes.items()
+        }
+
+        with self.lock:
+            self.tokens = [token for token, _ in pairs]
+            self.postings = array('I', (number for _, number in pairs))
+            self.entries = entries
+            self.entry_tokens = entry_tokens
+            self.short_prefixes = short_prefixes
+            self.generation = generation
+            self.built_at = time.monotonic()
+
+    def outdated(self, generation):
+        # Weights are views, which change without a new generation.
+        return generation != self.generation or time.monotonic() - self.built_at > settings.SUGGESTIONS_MAX_AGE
+
+    def refresh(self):
+        current = generation(TITLES_GENERATION)
+        if self.generation is None or not self.background:
+            # Nothing to serve yet: one request builds, the others wait.
+            with self.building:
+                if self.generation is None or self.outdated(current):
+                    self.build(current)
+        elif self.outdated(current) and self.building.acquire(blocking=False):
+            # The old index is served until the new one is ready.
+            threading.Thread(target=self.build_in_background, args=(current,), daemon=True).start()
+
+    def build_in_background(self, generation):
+        try:
+            self.build(generation)
+        except Exception:
+            logger.exception('Could not rebuild the suggestion index, serving the old one')
+        finally:
+            self.building.release()
+            connection.close()
+
+    def suggest(self, query, limit):
+        self.refresh()
+        terms = tokenize(query)
+        if not terms:
+            return []
+        limit = min(limit, MAX_LIMIT)
+
+        with self.lock:
+            tokens, postings, entries, entry_tokens = self.tokens, self.postings, self.entries, self.entry_tokens
+            short_prefixes = self.short_prefixes
+
+        *others, last = terms
+        if not others and len(last) <= SHORT_PREFIX:
+            numbers = short_prefixes.get(last, [])[:limit]
+        else:
+            start = bisect.bisect_left(tokens, last)
+            end = bisect.bisect_left(tokens, last + '\uffff', start)
+            candidates = {
+                number for number in postings[start:end]
+                if all(any(token.startswith(term) for token in entry_tokens[number]) for term in others)
+            }
+            numbers = heapq.nlargest(limit, candidates, key=lambda number: entries[number][0])
+
+        return [{'title': entries[number][1], 'url': entries[number][2], 'kind': entries[number][3]}
+                for number in numbers]
+
+
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,115 @@
+import json
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import mail_managers, send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Feedback, Order, Task
+
+registry = {}
+
+
+def task(func):
+    name = f'{func.__module__}.{func.__name__}'
+    registry[name] = func
+    func.delay = lambda *args: enqueue(name, *args)
+    return func
+
+
+def enqueue(name, *args):
+    if name not in registry:
+        raise ValueError(f'Unknown task {name}')
+
+    arguments = json.dumps(args)
+    transaction.on_commit(lambda: Task.objects.create(name=name, arguments=arguments))
+
+
+def claim(limit, visibility_timeout):
+    now = timezone.now()
+
+    Task.objects. \
+        filter(status=Task.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')). \
+        update(status=Task.FAILED, last_error='Visibility timeout expired', date_finished=now)
+
+    ready = Q(status=Task.PENDING, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+    candidates = Task.objects. \
+        filter(ready, attempts__lt=F('max_attempts')). \
+        order_by('run_after'). \
+        values_list('id', flat=True)[:limit]
+
+    claimed = []
+    for task_id in candidates:
+        # The same condition guards the update, so concurrent workers
+        # cannot claim one task twice.
+        updated = Task.objects. \
+            filter(ready, id=task_id, attempts__lt=F('max_attempts')). \
+            update(status=Task.RUNNING,
+                   locked_until=now + timedelta(seconds=visibility_timeout),
+                   attempts=F('attempts') + 1)
+        if updated:
+            claimed.append(task_id)
+
+    return list(Task.objects.filter(id__in=claimed))
+
+
+def run(task_obj):
+    func = registry.get(task_obj.name)
+
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {task_obj.name}')
+        func(*json.loads(task_obj.arguments))
+    except Exception:
+        fail(task_obj, traceback.format_exc())
+        return False
+
+    Task.objects.filter(id=task_obj.id).update(
+        status=Task.DONE, locked_until=None, last_error='', date_finished=timezone.now()
+    )
+    return True
+
+
+def fail(task_obj, error):
+    now = timezone.now()
+
+    if task_obj.attempts >= task_obj.max_attempts:
+        Task.objects.filter(id=task_obj.id).update(
+            status=Task.FAILED, locked_until=None, last_error=error, date_finished=now
+        )
+    else:
+        delay = settings.TASK_RETRY_DELAY * 2 ** (task_obj.attempts - 1)
+        Task.objects.filter(id=task_obj.id).update(
+            status=Task.PENDING, locked_until=None, last_error=error,
+            run_after=now + timedelta(seconds=delay)
+        )
+
+
+@task
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('customer').get(id=order_id)
+    send_mail(
+        subject=f'Заказ № {order.id} создан',
+        message='Спасибо за заказ! В ближайшее время с вами свяжется наш менеджер.',
+        from_email=None,
+        recipient_list=[order.customer.email],
+    )
+
+
+@task
+def notify_new_review(feedback_id):
+    feedback = Feedback.objects.select_related('product').get(id=feedback_id)
+    mail_managers(
+        subject=f'Новый отзыв: {feedback.product.title}',
+        message=f'{feedback.name}, оценка {feedback.rating}\n\n{feedback.text}',
+    )
+
+
+@task
+def build_feed(name, base_url):
+    from . import feeds
+
+    feeds.build(name, base_url)
@@ -0,0 +1,41 @@
+import re
+
+from django.template import Origin
+from django.template.loaders.base import Loader
+
+# Whitespace inside these blocks is significant.
+PROTECTED = re.compile(
+    r'(<pre\b.*?</pre>|<textarea\b.*?</textarea>|{%\s*blocktrans\b.*?{%\s*endblocktrans\s*%})',
+    re.DOTALL | re.IGNORECASE,
+)
+INDENTATION = re.compile(r'\n\s+')
+
+
+def minify(source):
+    # Drops indentation and blank lines from template source. Runs of
+    # whitespace become a single newline, so text never runs together.
+    parts = PROTECTED.split(source)
+    for index in range(0, len(parts), 2):
+        parts[index] = INDENTATION.sub('\n', parts[index])
+    return ''.join(parts)
+
+
+class MinifyingLoader(Loader):
+    # Wraps other loaders and minifies the source before it is compiled.
+    # Put it inside the cached loader so this happens once per template.
+
+    def __init__(self, engine, loaders):
+        super().__init__(engine)
+        self.loaders = engine.get_template_loaders(loaders)
+
+    def get_template_sources(self, template_name):
+        # The cached loader reads contents through origin.loader, so the
+        # origins of the wrapped loaders are handed out as our own.
+        for loader in self.loaders:
+            for source in loader.get_template_sources(template_name):
+                origin = Origin(source.name, source.template_name, self)
+                origin.source_loader = loader
+                yield origin
+
+    def get_contents(self, origin):
+        return minify(origin.source_loader.get_contents(origin))
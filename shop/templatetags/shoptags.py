@@ -6,3 +6,15 @@ register = template.Library()
 @register.filter(name='rating')
 def rating(value):
     return value * '★'
+
+
+@register.simple_tag(takes_context=True)
+def querystring(context, **kwargs):
+    query = context['request'].GET.copy()
+    query.pop('partial', None)
+    for key, value in kwargs.items():
+        if value is None or value == '':
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return f'?{query.urlencode()}' if query else '?'
@@ -1,7 +1,52 @@
-from django.test import TestCase
-from shop.models import User, Article, Subcategory, Product, Feedback, Category, Order
+import csv
+import gzip
+import importlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.template import Engine
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from shop import feeds, metrics, tasks
+from shop.counters import ViewCounter, product_views
+from shop.management.commands import generate_catalog
+from shop.models import User, Article, Subcategory, Product, Feedback, Category, Order, Task, ProductRanking, \
+    OrderProducts, DailyProductSales, DailyCategorySales, ProfileReport, SavedCart, \
+    ArchivedOrder, ArchivedOrderProducts, CartLine, copy_rows
+from shop.middleware import ProfilingMiddleware
 from shop.views import HomeView
+from shop.template_loaders import minify
+from shop.warmup import WARMUP_USER_AGENT, warm_up
+from shop.suggestions import SuggestionIndex, suggestion_index
 from shop.cart import Cart
+from shop.cache import FEEDS_GENERATION, bump_catalog_generation, catalog_generation
+from shop.filters import ProductFilter
+from shop.managers import ProductQuerySet
+from shop.throttling import Throttle, parse_rate
+from shop.context_processors import navbar
 
 
 class TestUserViews(TestCase):
@@ -106,6 +151,102 @@ class TestContentViews(TestCase):
         self.assertTrue(feedback, "Feedback saved in the database")
 
 
+class TestCanonicalPaths(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_path_set_on_save(self):
+        product = Product.objects.first()
+        product.slug = 'new-slug'
+        product.save()
+
+        self.assertEqual(Product.objects.get(id=product.id).path,
+                         f'/catalog/{product.category.slug}/{product.subcategory.slug}/new-slug/')
+
+    def test_category_slug_cascades(self):
+        category = Category.objects.first()
+        category.slug = 'renamed'
+        category.save()
+
+        for subcategory in Subcategory.objects.filter(category=category):
+            self.assertTrue(subcategory.path.startswith('/catalog/renamed/'))
+        for product in Product.objects.filter(category=category):
+            self.assertTrue(product.path.startswith('/catalog/renamed/'))
+
+    def test_subcategory_slug_cascades(self):
+        subcategory = Subcategory.objects.filter(product__isnull=False).first()
+        subcategory.slug = 'renamed'
+        subcategory.save()
+
+        for product in subcategory.products.all():
+            self.assertEqual(product.path, f'/catalog/{product.category.slug}/renamed/{product.slug}/')
+
+    def test_home_links_without_extra_queries(self):
+        # Articles, their products, popular products, navbar categories and subcategories.
+        with self.assertNumQueries(5):
+            self.client.get('/')
+
+
+class TestProductFilter(TestCase):
+    fixtures = ['fixtures.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subcategory = Subcategory.objects.filter(slug='noutbuki').first()
+        cls.url = f'/catalog/{cls.subcategory.category.slug}/{cls.subcategory.slug}/'
+
+    def setUp(self):
+        cache.clear()
+        # Workers read the generation from the cache, not the database.
+        catalog_generation()
+
+    def test_sort_by_price(self):
+        response = self.client.get(self.url, data={'sort': 'price'})
+        prices = [product.price for product in response.context_data['page_obj'].object_list]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(prices, sorted(prices), "Products are sorted by price")
+
+    def test_unknown_sort_is_ignored(self):
+        response = self.client.get(self.url, data={'sort': 'description'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['filter'].sort, ProductFilter.default_sort)
+
+    def test_price_filter(self):
+        response = self.client.get(self.url, data={'price': 3})
+        products = response.context_data['paginator'].object_list
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(product.price >= 40000 for product in products))
+
+    def test_rating_filter(self):
+        product = self.subcategory.products.first()
+        Feedback.objects.create(name='John Doe', text='Five stars!', rating=5, product=product)
+        response = self.client.get(self.url, data={'rating': 4})
+
+        self.assertEqual(list(response.context_data['paginator'].object_list), [product])
+
+    def test_facets_single_query(self):
+        products = self.subcategory.products.all()
+
+        with self.assertNumQueries(1):
+            facets = ProductFilter({}).facets(products, self.subcategory)
+        with self.assertNumQueries(0):
+            ProductFilter({}).facets(products, self.subcategory)
+
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price']), products.count(),
+                         "Every product falls into exactly one price bucket")
+
+
+def save_cart(client, quantities):
+    cart = SavedCart.objects.create(token=uuid.uuid4().hex)
+    cart.add(quantities)
+    session = client.session
+    session[SavedCart.TOKEN_SESSION_KEY] = cart.token
+    session.save()
+    return cart
+
+
 class TestCart(TestCase):
 
     fixtures = ['fixtures.json']
@@ -113,37 +254,42 @@ class TestCart(TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.product = Product.objects.first()
-        cls.session_cart = {str(cls.product.id): 1}
+        cls.quantities = {cls.product.id: 1}
 
-    def test_add_product(self):
+    def add_product(self):
         url = f'/cart/add/{self.product.id}/'
-        response = self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_add_product(self):
+        response = self.add_product()
+        cart = SavedCart.objects.get(token=self.client.session[SavedCart.TOKEN_SESSION_KEY])
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.client.session.get('cart'), self.session_cart,
-                         "The product is in the cart")
+        self.assertEqual(cart.quantities(), self.quantities, "The product is in the cart")
+
+        self.add_product()
+        self.assertEqual(cart.quantities(), {self.product.id: 2}, "Quantities are upserted")
 
     def test_cart(self):
-        url = f'/cart/add/{self.product.id}/'
-        self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.add_product()
         response = self.client.get('/cart/')
+        owner = {'token': self.client.session[SavedCart.TOKEN_SESSION_KEY]}
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(Cart(self.session_cart), response.context_data.get('cart'))
+        self.assertEqual(Cart(owner), response.context_data.get('cart'))
+        self.assertEqual(Cart(owner).quantities(), self.quantities)
 
     def test_clean_cart(self):
-        session = self.client.session
-        session['cart'] = self.session_cart
-        session.save()
+        cart = save_cart(self.client, self.quantities)
         response = self.client.get('/cart/?clear=1', follow=True)
 
         self.assertIn(('/cart/', 302), response.redirect_chain,
                       "Cart is cleaned, redirect back to the cart page")
         self.assertEqual(response.status_code, 200)
-        self.assertIsNone(self.client.session.get('cart'))
+        self.assertEqual(cart.quantities(), {})
 
     def test_no_auth_checkout(self):
-        self.client.session['cart'] = self.session_cart
+        save_cart(self.client, self.quantities)
         response = self.client.post('/new-order/', follow=True)
 
         self.assertIn(('/login/?next=/new-order/', 302), response.redirect_chain,
@@ -153,14 +299,1337 @@ class TestCart(TestCase):
     def test_checkout(self):
         email = 'test@example.com'
         password = 'testpassword'
-        User.objects.create_user(email, password)
+        user = User.objects.create_user(email, password)
         self.client.login(username=email, password=password)
-        session = self.client.session
-        session['cart'] = self.session_cart
-        session.save()
+        SavedCart.objects.create(user=user).add(self.quantities)
 
         response = self.client.post('/new-order/')
         order = Order.objects.first()
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(order.id, response.context_data.get('order_id'))
+        self.assertEqual(user.saved_cart.quantities(), {}, "The cart is emptied")
+
+    def test_repeated_checkout(self):
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        self.client.force_login(user)
+        SavedCart.objects.create(user=user).add(self.quantities)
+        key = self.client.get('/cart/').context['idempotency_key']
+
+        first = self.client.post('/new-order/', {'idempotency_key': key})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post('/new-order/', {'idempotency_key': key})
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(first.context_data['order_id'], second.context_data['order_id'])
+        self.assertFalse([query for query in queries if not query['sql'].startswith('SELECT')])
+
+    def test_merge_on_login(self):
+        first, second = Product.objects.all()[:2]
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        SavedCart.objects.create(user=user).add({first.id: 1})
+        anonymous = save_cart(self.client, {first.id: 2, second.id: 1})
+
+        self.client.post('/login/', {'username': 'test@example.com', 'password': 'testpassword'})
+
+        self.assertEqual(user.saved_cart.quantities(), {first.id: 3, second.id: 1})
+        self.assertFalse(SavedCart.objects.filter(id=anonymous.id).exists())
+        self.assertNotIn(SavedCart.TOKEN_SESSION_KEY, self.client.session)
+
+    def test_cart_survives_logout(self):
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        SavedCart.objects.create(user=user).add(self.quantities)
+        self.client.force_login(user)
+        self.client.post('/logout/')
+        self.client.force_login(user)
+
+        self.assertEqual(self.client.get('/cart/').context_data['cart'].quantities(), self.quantities)
+
+    def test_expire_carts(self):
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        SavedCart.objects.create(user=user).add(self.quantities)
+        SavedCart.objects.create(token='old').add(self.quantities)
+        fresh = save_cart(self.client, self.quantities)
+        SavedCart.objects.exclude(id=fresh.id).update(date_updated=timezone.now() - timedelta(days=31))
+
+        call_command('expire_carts', days=30, sleep=0, stdout=StringIO())
+
+        self.assertEqual(set(SavedCart.objects.values_list('id', flat=True)), {user.saved_cart.id, fresh.id})
+        self.assertEqual(CartLine.objects.count(), 2)
+
+
+class TestLeanQuerysets(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        cache.clear()
+        catalog_generation()
+
+    def test_listing_defers_unused_columns(self):
+        product = Product.objects.for_listing().first()
+
+        self.assertIn('description', product.get_deferred_fields())
+        self.assertNotIn('image', product.get_deferred_fields())
+
+    def test_listing_memory(self):
+        Product.objects.update(description='x' * 100000)
+
+        def peak(queryset):
+            tracemalloc.start()
+            try:
+                list(queryset)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        full, listing = peak(Product.objects.all()), peak(Product.objects.for_listing())
+
+        self.assertGreater(full, Product.objects.count() * 100000)
+        self.assertLess(listing, full / 10)
+
+    def test_cart_reads_description_summary(self):
+        product = Product.objects.first()
+        Product.objects.filter(id=product.id).update(description='x' * 500)
+        cart = save_cart(self.client, {product.id: 1})
+
+        self.assertEqual(len(Cart({'token': cart.token}).items[0].description), ProductQuerySet.CART_SUMMARY_LENGTH)
+
+    def test_product_list_queries(self):
+        subcategory = Subcategory.objects.filter(slug='noutbuki').first()
+
+        # Subcategory, count, page, facets, navbar categories and subcategories.
+        with self.assertNumQueries(6):
+            response = self.client.get(subcategory.path)
+
+        for product in response.context_data['page_obj']:
+            self.assertIn('description', product.get_deferred_fields())
+
+    def test_product_detail_queries(self):
+        product = Product.objects.first()
+
+        # Product, reviews, navbar categories and subcategories.
+        with self.assertNumQueries(4):
+            response = self.client.get(product.path)
+
+        self.assertEqual(response.context_data['product'].get_deferred_fields(),
+                         {'category_id', 'subcategory_id', 'rating', 'views'})
+
+    def test_cart_queries(self):
+        save_cart(self.client, {product.id: 1 for product in Product.objects.all()[:3]})
+
+        # Session, cart lines with products, navbar categories and subcategories.
+        with self.assertNumQueries(4):
+            response = self.client.get('/cart/')
+
+        self.assertEqual(len(response.context_data['cart'].items), 3)
+
+
+class TestPartialResponses(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        cache.clear()
+        catalog_generation()
+
+    def test_product_list_partial(self):
+        subcategory = Subcategory.objects.filter(slug='noutbuki').first()
+
+        # Subcategory, count, page and facets; the navbar is skipped.
+        with self.assertNumQueries(4):
+            response = self.client.get(f'{subcategory.path}?partial=1&sort=price')
+
+        self.assertTemplateNotUsed(response, 'shop/base.html')
+        self.assertNotContains(response, 'navbar')
+        self.assertNotContains(response, 'partial=1')
+        self.assertIn('X-Requested-With', response['Vary'])
+
+    def test_cart_partial_on_xhr(self):
+        response = self.client.get('/cart/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertTemplateUsed(response, 'shop/cart_content.html')
+        self.assertTemplateNotUsed(response, 'shop/base.html')
+
+    def test_feedback_partial(self):
+        product = Product.objects.first()
+        data = {'name': 'John Doe', 'text': 'Five stars!', 'rating': 5, 'product': product.id}
+
+        response = self.client.post(product.path, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Five stars!')
+        self.assertTemplateNotUsed(response, 'shop/base.html')
+
+        response = self.client.post(product.path, {**data, 'rating': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+        self.assertTemplateUsed(response, 'shop/product_fragment.html')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                       'LOCATION': 'warm_cache'}})
+class TestWarmCache(TestCase):
+    fixtures = ['fixtures.json']
+
+    @classmethod
+    def setUpClass(cls):
+        # A database cache is shared by every process, like memcached.
+        # Loading the fixtures already writes to it.
+        call_command('createcachetable', 'warm_cache', stdout=StringIO())
+        super().setUpClass()
+
+    def test_warm_cache(self):
+        product = Product.objects.last()
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        Order.checkout(user, {str(product.id): 3})
+        stdout = StringIO()
+        call_command('warm_cache', workers=1, rate=0, stdout=stdout, stderr=StringIO())
+        lines = stdout.getvalue().splitlines()
+        urls = [line.split()[-1] for line in lines if line.startswith(('200', '404', '500'))]
+
+        self.assertIn('All pages rendered', stdout.getvalue())
+        self.assertEqual(urls[0], '/')
+        self.assertEqual(len(urls), 1 + Category.objects.count() + Subcategory.objects.count() +
+                         Product.objects.count() + Article.objects.count())
+        self.assertLess(urls.index(product.path), urls.index(Product.objects.first().path),
+                        "Recently ordered products are warmed first")
+
+    def test_refuses_process_local_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'shop.metrics.LocMemCache'}}):
+            with self.assertRaisesMessage(CommandError, 'local to this process'):
+                call_command('warm_cache', workers=1, rate=0, stdout=StringIO(), stderr=StringIO())
+
+
+class TestTaskQueue(TestCase):
+
+    def test_run_task(self):
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        order_id = Order.checkout(user, {})
+        Task.objects.create(name='shop.tasks.send_order_confirmation', arguments=json.dumps([order_id]))
+        claimed = tasks.claim(10, visibility_timeout=60)
+
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(tasks.claim(10, visibility_timeout=60), [], "A claimed task is not handed out twice")
+        self.assertTrue(tasks.run(claimed[0]))
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_retry_then_fail(self):
+        Task.objects.create(name='shop.tasks.unknown', max_attempts=2)
+
+        task = tasks.claim(1, visibility_timeout=60)[0]
+        tasks.run(task)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.PENDING)
+        self.assertGreater(task.run_after, timezone.now(), "Retry is delayed")
+
+        Task.objects.update(run_after=timezone.now())
+        tasks.run(tasks.claim(1, visibility_timeout=60)[0])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIn('LookupError', task.last_error)
+
+    def test_visibility_timeout(self):
+        Task.objects.create(name='shop.tasks.notify_new_review', status=Task.RUNNING, attempts=1,
+                            locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(len(tasks.claim(1, visibility_timeout=60)), 1,
+                         "A task whose worker died is handed out again")
+
+
+def create_product():
+    # TransactionTestCase cannot load fixtures.json twice: the fixture pins
+    # content type ids that differ from the ones recreated after a flush.
+    category = Category.objects.create(title='Электроника', slug='elektronika')
+    subcategory = Subcategory.objects.create(title='Смартфоны', slug='smartfony', category=category)
+    return Product.objects.create(title='Смартфон', slug='smartfon', description='Смартфон', price=10000,
+                                  image='product_images/orig.webp', category=category, subcategory=subcategory)
+
+
+class TestTaskEnqueue(TransactionTestCase):
+
+    def test_feedback_enqueues_task(self):
+        product = create_product()
+        feedback_data = {'name': "John Doe", "text": "Five stars!", 'rating': 5, 'product': product.id}
+        self.client.post(product.get_absolute_url(), data=feedback_data)
+
+        self.assertTrue(Task.objects.filter(name='shop.tasks.notify_new_review').exists())
+
+
+class TestPopularProducts(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_view_counter_batches_updates(self):
+        counter = ViewCounter(flush_interval=60, flush_threshold=4)
+        first, second = Product.objects.all()[:2]
+
+        with self.assertNumQueries(0):
+            for product in (first, second, first):
+                counter.hit(product.id)
+        with self.assertNumQueries(1):
+            counter.hit(second.id)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.views, second.views), (2, 2))
+
+    def test_ranking(self):
+        viewed, sold = Product.objects.all()[:2]
+        Product.objects.filter(id=viewed.id).update(views=10)
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        Order.checkout(user, {str(sold.id): 1})
+        ProductRanking.recompute(size=10, days=30, sale_weight=20)
+
+        self.assertEqual(list(ProductRanking.objects.order_by('rank').values_list('product', flat=True)),
+                         [sold.id, viewed.id])
+
+        response = self.client.get('/')
+        self.assertEqual([ranking.product for ranking in response.context_data['popular_products']],
+                         [sold, viewed])
+
+
+class TestSalesRollups(TestCase):
+    fixtures = ['fixtures.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin@example.com', 'testpassword')
+        first, second = Product.objects.all()[:2]
+        Order.checkout(cls.user, {str(first.id): 2, str(second.id): 1})
+        Order.checkout(cls.user, {str(first.id): 1})
+        cls.first, cls.second = first, second
+
+    def test_checkout_updates_rollups(self):
+        sales = DailyProductSales.objects.get(product=self.first)
+
+        self.assertEqual((sales.units, sales.revenue, sales.orders), (3, 3 * self.first.price, 2))
+        self.assertEqual(OrderProducts.objects.get(product=self.second).price,
+                         self.second.price, "Price is snapshotted at checkout")
+
+    def test_rebuild_matches_incremental(self):
+        fields = ('day', 'category', 'units', 'revenue', 'orders')
+        incremental = list(DailyCategorySales.objects.order_by('category').values_list(*fields))
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        self.assertEqual(list(DailyCategorySales.objects.order_by('category').values_list(*fields)), incremental)
+
+    def test_dashboard_reads_rollups_only(self):
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/shop/dailycategorysales/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.first.title)
+        self.assertFalse(any('orderproducts' in query['sql'] for query in queries))
+
+    def test_dashboard_clamps_days(self):
+        self.client.force_login(self.user)
+
+        for days, clamped in (('0', 1), ('-5', 1), ('1000000000', 366)):
+            response = self.client.get('/admin/shop/dailycategorysales/', {'days': days})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['days'], clamped)
+
+
+class TestFeeds(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        cache.clear()
+        self.feed_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(FEED_CACHE_DIR=self.feed_dir.name, SITEMAP_CHUNK_SIZE=10)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.feed_dir.cleanup()
+
+    def get_content(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_sitemap_chunks(self):
+        index = self.get_content('/sitemap.xml')
+        chunks = [self.get_content(f'/sitemap-products-{chunk}.xml') for chunk in (1, 2, 3)]
+
+        self.assertIn('http://testserver/sitemap-products-3.xml', index)
+        self.assertNotIn('sitemap-products-4.xml', index)
+        self.assertEqual(self.client.get('/sitemap-products-4.xml').status_code, 404)
+        self.assertEqual(sum(chunk.count('<url>') for chunk in chunks), Product.objects.count())
+        self.assertIn(f'http://testserver{Product.objects.order_by("id").first().path}', chunks[0])
+
+    def test_sitemap_chunks_by_id_range(self):
+        Product.objects.filter(id__in=Product.objects.order_by('id').values('id')[3:8]).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            chunks = [self.get_content(f'/sitemap-products-{chunk}.xml') for chunk in (1, 2, 3)]
+        paths = [path for chunk in chunks for path in re.findall(r'<loc>http://testserver(.*?)</loc>', chunk)]
+
+        self.assertEqual(paths, list(Product.objects.order_by('id').values_list('path', flat=True)))
+        self.assertEqual([chunk.count('<url>') for chunk in chunks], [10, 10, Product.objects.count() - 20])
+        offsets = {int(offset) for query in queries for offset in re.findall(r'OFFSET (\d+)', query['sql'])}
+        self.assertLessEqual(offsets, {10}, "No offset grows with the chunk number")
+
+    def test_csv_feed(self):
+        rows = list(csv.reader(StringIO(self.get_content('/feed.csv'))))
+
+        self.assertEqual(len(rows), Product.objects.count() + 1)
+
+    def test_rebuilt_by_task_on_catalog_change(self):
+        self.get_content('/feed.yml')
+        product = Product.objects.first()
+        product.price = 1
+        product.save()
+
+        with mock.patch('shop.feeds.build_feed.delay') as delay:
+            self.assertNotIn('<price>1</price>', self.get_content('/feed.yml'), "The previous file is served")
+            self.get_content('/feed.yml')
+        delay.assert_called_once_with('feed.yml', 'http://testserver')
+
+        tasks.build_feed('feed.yml', 'http://testserver')
+        self.assertIn('<price>1</price>', self.get_content('/feed.yml'))
+        self.assertEqual(len(os.listdir(self.feed_dir.name)), 1, "Stale files are removed")
+
+    def test_reviews_keep_files(self):
+        self.get_content('/feed.csv')
+        Feedback.objects.create(product=Product.objects.first(), name='Тест', text='Отзыв', rating=5)
+
+        with mock.patch('shop.feeds.build') as build, mock.patch('shop.feeds.build_feed.delay') as delay:
+            self.get_content('/feed.csv')
+        build.assert_not_called()
+        delay.assert_not_called()
+
+    def test_failed_build_leaves_no_files(self):
+        with mock.patch('shop.feeds.write_csv_feed', side_effect=RuntimeError), \
+                mock.patch.dict(feeds.WRITERS, {'feed.csv': feeds.write_csv_feed}):
+            with self.assertRaises(RuntimeError):
+                feeds.build('feed.csv', 'http://testserver')
+
+        self.assertEqual(os.listdir(self.feed_dir.name), [])
+
+    def test_lagging_worker_keeps_newer_files(self):
+        generation = feeds.generation(FEEDS_GENERATION)
+        self.get_content('/feed.csv')
+        with mock.patch('shop.feeds.generation', return_value=generation - 1):
+            self.get_content('/feed.yml')
+
+        files = os.listdir(self.feed_dir.name)
+        self.assertEqual(len([name for name in files if name.startswith(f'{generation}-')]), 1, files)
+
+    def test_open_file_survives_removal(self):
+        base_url = 'http://testserver'
+        with feeds.cached_file('feed.csv', base_url) as fh:
+            Product.objects.first().save()
+            feeds.build('feed.csv', base_url)
+
+            self.assertEqual(len(list(csv.reader(StringIO(fh.read().decode())))), Product.objects.count() + 1)
+        self.assertEqual(len(os.listdir(self.feed_dir.name)), 1)
+
+
+class TestProductShell(TestCase):
+    fixtures = ['fixtures.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.first()
+        Feedback.objects.create(name='John Doe', text='Five stars!', rating=5, product=cls.product)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shell_has_no_per_user_parts(self):
+        response = self.client.get(self.product.path)
+
+        self.assertContains(response, 'Five stars!')
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, f'/fragments/product/{self.product.id}/')
+
+    def test_shell_is_cached(self):
+        self.client.get(self.product.path)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.product.path)
+        self.assertFalse(any('feedbacks' in query['sql'] for query in queries),
+                         "Reviews are rendered from the cached shell")
+
+    def test_fragment(self):
+        save_cart(self.client, {self.product.id: 2})
+        response = self.client.get(f'/fragments/product/{self.product.id}/')
+
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'В корзине: 2 шт.')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_views_counted_by_fragment(self):
+        product_views.flush()
+        views = Product.objects.get(id=self.product.id).views
+        self.client.get(self.product.path)
+        self.client.get(self.product.path)
+        self.client.get(f'/fragments/product/{self.product.id}/')
+        self.client.get(f'/fragments/product/{self.product.id}/', HTTP_USER_AGENT=WARMUP_USER_AGENT)
+        product_views.flush()
+
+        self.assertEqual(Product.objects.get(id=self.product.id).views, views + 1)
+
+    def test_invalid_feedback_renders_form_inline(self):
+        response = self.client.post(self.product.path, data={'product': self.product.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+purged_paths = []
+
+
+def record_purge(paths):
+    purged_paths.append(paths)
+
+
+class TestPublicCaching(TestCase):
+    fixtures = ['fixtures.json']
+
+    def assertShareable(self, url):
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'], url)
+        self.assertIn('s-maxage', response['Cache-Control'], url)
+        self.assertEqual(response.cookies, {}, url)
+
+    def assertPrivate(self, url):
+        response = self.client.get(url)
+
+        self.assertNotIn('public', response.get('Cache-Control', ''), url)
+
+    def test_catalog_pages_are_shareable(self):
+        product = Product.objects.first()
+
+        for url in ('/', product.category.path, product.subcategory.path, product.path,
+                    Article.objects.first().path):
+            self.assertShareable(url)
+
+    def test_user_pages_are_private(self):
+        for url in ('/cart/', '/login/', f'/fragments/product/{Product.objects.first().id}/'):
+            self.assertPrivate(url)
+
+    def test_csrf_cookie_keeps_pages_shareable(self):
+        product = Product.objects.first()
+        token = self.client.get(f'/fragments/product/{product.id}/').cookies[settings.CSRF_COOKIE_NAME].value
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = token
+
+        self.assertShareable(product.path)
+        self.assertNotIn('Cookie', self.client.get(product.path).get('Vary', ''),
+                         "One shared copy for every visitor")
+
+    def test_catalog_pages_are_private_with_session(self):
+        User.objects.create_user('test@example.com', 'testpassword')
+        self.client.login(username='test@example.com', password='testpassword')
+
+        self.assertPrivate('/')
+
+
+class TestConcurrentCheckout(TransactionTestCase):
+
+    def test_same_key_from_many_threads(self):
+        product = create_product()
+        user = User.objects.create_user('test@example.com', 'testpassword')
+        SavedCart.objects.create(user=user).add({product.id: 1})
+        key = uuid.uuid4()
+        threads = 8
+        barrier = threading.Barrier(threads)
+        results = []
+
+        def place():
+            barrier.wait()
+            try:
+                # The in-memory test database shares its cache between
+                # connections and fails with "table is locked" instead of
+                # waiting for the lock like a database file does.
+                while True:
+                    try:
+                        results.append(Order.place(user, {product.id: 1}, key))
+                        break
+                    except OperationalError:
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=place) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        order = Order.objects.get()
+        self.assertEqual(order.idempotency_key, key)
+        self.assertEqual(OrderProducts.objects.count(), 1)
+        self.assertEqual(len(results), threads)
+        self.assertEqual({order_id for order_id, _ in results}, {order.id})
+        self.assertEqual(sum(created for _, created in results), 1)
+
+
+@override_settings(CACHE_PURGE_BACKEND='shop.tests.record_purge')
+class TestCachePurge(TransactionTestCase):
+
+    def setUp(self):
+        self.product = create_product()
+        purged_paths.clear()
+
+    def test_product_change_purges_listing(self):
+        product = self.product
+        product.price += 1
+        product.save()
+
+        self.assertEqual(len(purged_paths), 1)
+        self.assertIn(product.path, purged_paths[0])
+        self.assertIn(product.subcategory.path, purged_paths[0])
+
+    def test_category_change_purges_everything(self):
+        category = Category.objects.first()
+        category.title = 'Новый раздел'
+        category.save()
+
+        self.assertEqual(purged_paths, [['*']])
+
+    def test_bulk_price_change_purges_once(self):
+        product = self.product
+        other = Product.objects.create(title='Смартфон 2', slug='smartfon-2', description='Смартфон', price=20000,
+                                       image='product_images/orig.webp', category=product.category,
+                                       subcategory=product.subcategory)
+        purged_paths.clear()
+        generation = catalog_generation()
+
+        changed = Product.set_prices({product.id: 11000, other.id: 20000}, batch_size=1)
+
+        self.assertEqual(changed, 1)
+        self.assertEqual(Product.objects.get(id=product.id).price, 11000)
+        self.assertEqual(purged_paths, [sorted({product.path, product.subcategory.path, product.category.path, '/'})])
+        self.assertEqual(catalog_generation(), generation + 1)
+
+
+class TestCatalogGeneration(TestCase):
+    # Every worker has its own copy of the generation; the copies must
+    # agree, or each worker keeps its own catalog cache.
+
+    def generation(self, worker_cache, now=None):
+        with mock.patch('shop.cache.cache', worker_cache), \
+                mock.patch('shop.cache.time.time', return_value=now or time.time()):
+            return catalog_generation()
+
+    def test_workers_agree(self):
+        first, second = LocMemCache('first-worker', {}), LocMemCache('second-worker', {})
+
+        generation = self.generation(first, now=1000)
+        self.assertEqual(self.generation(second, now=2000), generation)
+
+        with mock.patch('shop.cache.cache', first):
+            bump_catalog_generation()
+        self.assertEqual(self.generation(first), generation + 1)
+
+        second.clear()  # its copy expired
+        self.assertEqual(self.generation(second), generation + 1)
+
+    def test_bump_reaches_shared_cache(self):
+        generation = catalog_generation()
+        Product.objects.update(price=1)
+        bump_catalog_generation()
+        self.assertEqual(catalog_generation(), generation + 1)
+
+
+class TestProfiling(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PROFILING_DIR=self.profile_dir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.profile_dir.cleanup()
+
+    def test_staff_profiles_request(self):
+        user = User.objects.create_superuser('admin@example.com', 'testpassword')
+        self.client.force_login(user)
+        self.client.get('/', HTTP_X_PROFILE='1')
+        report = ProfileReport.objects.get()
+
+        self.assertEqual(report.url_name, 'home')
+        self.assertGreater(report.query_count, 0)
+        self.assertTrue(os.path.exists(report.file_path))
+
+        response = self.client.get(f'/admin/shop/profilereport/{report.id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_anonymous_cannot_profile(self):
+        self.client.get('/?profile=1')
+
+        self.assertFalse(ProfileReport.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_anonymous_request_skips_user(self):
+        # No request.user: reading it would fail.
+        self.assertFalse(ProfilingMiddleware.should_profile(RequestFactory().get('/')))
+        self.assertFalse(ProfilingMiddleware.should_profile(RequestFactory().get('/?profile=1')))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        self.client.get('/')
+
+        self.assertEqual(ProfileReport.objects.get().path, '/')
+
+
+class TestProfileCleanup(TransactionTestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PROFILING_DIR=self.profile_dir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.profile_dir.cleanup()
+
+    def create_report(self, filename):
+        with open(os.path.join(self.profile_dir.name, filename), 'w'):
+            pass
+        return ProfileReport.objects.create(method='GET', path='/', status_code=200, duration=1, query_count=0,
+                                            query_time=0, sql_summary='', stats_summary='', filename=filename)
+
+    def test_deleted_reports_remove_files(self):
+        reports = [self.create_report(f'{number}.prof') for number in range(3)]
+        self.client.force_login(User.objects.create_superuser('admin@example.com', 'testpassword'))
+
+        self.client.post(f'/admin/shop/profilereport/{reports[0].id}/delete/', {'post': 'yes'})
+        self.assertEqual(sorted(os.listdir(self.profile_dir.name)), ['1.prof', '2.prof'])
+
+        self.client.post('/admin/shop/profilereport/', {
+            'action': 'delete_selected',
+            'post': 'yes',
+            '_selected_action': [report.id for report in reports[1:]],
+        })
+        self.assertFalse(ProfileReport.objects.exists())
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+
+class TestGenerateCatalog(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_generate(self):
+        products = Product.objects.count()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('generate_catalog', scale=0.01, stdout=StringIO())
+
+            self.assertTrue(os.path.exists(os.path.join(media_root, 'product_images', 'generated')))
+
+        self.assertEqual(Product.objects.count(), products + 100)
+        self.assertEqual(Order.objects.count(), 200)
+        self.assertFalse(OrderProducts.objects.filter(price__isnull=True).exists())
+        self.assertEqual(DailyProductSales.objects.aggregate(units=Sum('units'))['units'],
+                         OrderProducts.objects.aggregate(units=Sum('quantity'))['units'])
+
+        product = Product.objects.latest('id')
+        self.assertEqual(product.path, product.build_path())
+        self.assertEqual(self.client.get(product.path).status_code, 200)
+
+    def test_skewed_follows_each_list(self):
+        command = generate_catalog.Command()
+        command.random = random.Random(1)
+        items = ['first', 'second', 'third']
+
+        picks = Counter(command.skewed(items, generate_catalog.popularity(len(items))) for _ in range(10000))
+
+        self.assertGreater(picks['first'], picks['second'])
+        self.assertGreater(picks['second'], picks['third'])
+        self.assertAlmostEqual(picks['first'] / 10000, 1 / sum(1 / rank ** 1.1 for rank in (1, 2, 3)), delta=0.02)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class TestMetrics(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(METRICS_DIR=self.metrics_dir.name)
+        self.settings.enable()
+        metrics.registry.reset()
+        cache.clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.metrics_dir.cleanup()
+
+    def test_request_metrics(self):
+        product = Product.objects.first()
+        self.client.get('/')
+        self.client.get(f'/cart/add/{product.id}/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.get(product.path)
+        self.client.get(product.path)
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+
+        self.assertIn('http_requests_total{method="GET",status="200",view="home"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="home",le="+Inf"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{view="home"} 1', body)
+        self.assertIn('db_queries_total{view="home"} 5', body)
+        self.assertIn('shop_cart_additions_total 1', body)
+        self.assertIn('session_writes_total 1', body)
+        self.assertIn('cache_requests_total{cache="default",result="hit"}', body)
+
+    def test_aggregates_processes(self):
+        metrics.registry.inc('shop_checkouts_total', 2)
+        with open(os.path.join(self.metrics_dir.name, '1-other.json'), 'w') as fh:
+            json.dump({'counters': [['shop_checkouts_total', [], 3]], 'histograms': []}, fh)
+
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('shop_checkouts_total 5', body)
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 404,
+                         "The address of a local proxy is not enough")
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer None').status_code, 404)
+
+
+class TestSuggestions(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_prefix_ranked_by_views(self):
+        Product.objects.filter(title='Xiaomi Mi Note 10 6/128GB').update(views=100)
+        index = SuggestionIndex(background=False)
+
+        suggestions = index.suggest('xiao', 3)
+
+        self.assertEqual(len(suggestions), 3)
+        self.assertEqual(suggestions[0]['title'], 'Xiaomi Mi Note 10 6/128GB')
+        self.assertEqual(suggestions[0]['url'], Product.objects.get(title='Xiaomi Mi Note 10 6/128GB').path)
+        self.assertTrue(all(suggestion['title'].startswith('Xiaomi') for suggestion in suggestions))
+
+    def test_several_terms(self):
+        index = SuggestionIndex(background=False)
+
+        titles = [suggestion['title'] for suggestion in index.suggest('redmi no', 10)]
+
+        self.assertCountEqual(titles, ['Xiaomi Redmi Note 8 Pro 6 128GB', 'Xiaomi Redmi Note 8 4/64GB'])
+        self.assertEqual(index.suggest('x', 10), index.suggest('x', 10))
+        self.assertEqual(index.suggest('  ', 10), [])
+
+    def test_no_queries_until_catalog_changes(self):
+        index = SuggestionIndex(background=False)
+        before = index.suggest('lg', 10)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(index.suggest('lg', 10), before)
+
+        Product.objects.create(title='LG Gram 14', slug='lg-gram-14', price=100000,
+                               category=Category.objects.first(), subcategory=Subcategory.objects.first())
+
+        self.assertEqual(len(index.suggest('lg', 10)), len(before) + 1)
+
+    def test_reviews_keep_index(self):
+        index = SuggestionIndex(background=False)
+        index.suggest('lg', 10)
+        product = Product.objects.first()
+
+        Feedback.objects.create(product=product, name='Тест', text='Отзыв', rating=5)
+        product.save(update_fields=['price'])
+
+        with self.assertNumQueries(0):
+            index.suggest('lg', 10)
+
+    def test_rebuilds_in_background(self):
+        index = SuggestionIndex()
+        before = index.suggest('lg', 10)
+        started, finish = threading.Event(), threading.Event()
+
+        def build(generation):
+            started.set()
+            finish.wait(5)
+
+        Product.objects.first().save()
+        with mock.patch.object(index, 'build', side_effect=build) as build_mock:
+            self.assertEqual(index.suggest('lg', 10), before, "The old index is served meanwhile")
+            self.assertTrue(started.wait(5))
+            self.assertEqual(index.suggest('lg', 10), before)
+            finish.set()
+            while index.building.locked():
+                time.sleep(0.01)
+
+        self.assertEqual(build_mock.call_count, 1, "One rebuild at a time")
+
+    def test_categories_and_articles(self):
+        index = SuggestionIndex(background=False)
+        category = Category.objects.first()
+
+        suggestions = index.suggest(category.title, 10)
+
+        self.assertIn({'title': category.title, 'url': category.path, 'kind': 'category'}, suggestions)
+
+    def test_view(self):
+        suggestion_index.generation = None
+
+        response = self.client.get('/suggestions/', {'q': 'sams'})
+
+        self.assertEqual(response.status_code, 200)
+        titles = [suggestion['title'] for suggestion in response.json()['suggestions']]
+        self.assertIn('Samsung Galaxy A51 64GB', titles)
+        self.assertIn('public', response['Cache-Control'])
+
+
+class TestWarmUp(TestCase):
+
+    def test_warm_up_without_queries(self):
+        with self.assertNumQueries(0):
+            warm_up()
+
+    def import_production_settings(self, environ):
+        with mock.patch.dict(os.environ, environ):
+            sys.modules.pop('transpozon.settings_production', None)
+            return importlib.import_module('transpozon.settings_production')
+
+    def test_production_settings(self):
+        production = self.import_production_settings({'DJANGO_SECRET_KEY': 'production'})
+
+        self.assertFalse(production.DEBUG)
+        self.assertNotIn('debug_toolbar', production.INSTALLED_APPS)
+        self.assertFalse(any(middleware.startswith('debug_toolbar.') for middleware in production.MIDDLEWARE))
+        self.assertEqual(production.TEMPLATES[0]['OPTIONS']['loaders'][0][0], 'django.template.loaders.cached.Loader')
+        self.assertEqual(production.SECRET_KEY, 'production')
+        self.assertNotEqual(production.CACHES['default']['BACKEND'], 'shop.metrics.LocMemCache')
+
+    def test_production_settings_require_secret_key(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.import_production_settings({'DJANGO_SECRET_KEY': ''})
+
+
+class TestCompression(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_minify(self):
+        source = '<div>\n    <p>\n        {{ text }}\n    </p>\n\n</div>\n<pre>\n    keep\n</pre>'
+
+        self.assertEqual(minify(source), '<div>\n<p>\n{{ text }}\n</p>\n</div>\n<pre>\n    keep\n</pre>')
+
+    def test_minifying_loader(self):
+        loaders = [('django.template.loaders.cached.Loader', [
+            ('shop.template_loaders.MinifyingLoader', ['django.template.loaders.app_directories.Loader']),
+        ])]
+        engine = Engine(loaders=loaders,
+                        libraries={'humanize': 'django.contrib.humanize.templatetags.humanize'})
+        template = engine.get_template('shop/cart_content.html')
+
+        self.assertNotIn('\n ', template.source)
+
+    def test_gzip(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity; q=0.5')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('Транспозон', gzip.decompress(response.content).decode())
+
+    def test_refused_encoding(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_small_body_not_compressed(self):
+        product = Product.objects.first()
+        response = self.client.get(f'/cart/add/{product.id}/', HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        with tempfile.TemporaryDirectory() as feed_dir, override_settings(FEED_CACHE_DIR=feed_dir):
+            response = self.client.get('/feed.csv', HTTP_ACCEPT_ENCODING='gzip')
+            content = gzip.decompress(b''.join(response.streaming_content)).decode()
+            response.close()
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertTrue(content.startswith('id,title,price'))
+
+
+class TestOrderArchive(TestCase):
+    fixtures = ['fixtures.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin@example.com', 'testpassword')
+        first, second = Product.objects.all()[:2]
+        cls.old_id = Order.checkout(cls.user, {first.id: 2, second.id: 1})
+        cls.new_id = Order.checkout(cls.user, {first.id: 1})
+        Order.objects.filter(id=cls.old_id).update(date_created=timezone.now() - timedelta(days=400))
+
+    def test_archive_and_restore(self):
+        lines = list(OrderProducts.objects.filter(order_id=self.old_id).order_by('id').values_list())
+        call_command('archive_orders', days=365, sleep=0, stdout=StringIO())
+
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [self.new_id])
+        self.assertEqual(ArchivedOrder.objects.get().orderproducts.count(), 2)
+
+        ArchivedOrder.restore([self.old_id])
+
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertEqual(list(OrderProducts.objects.filter(order_id=self.old_id).order_by('id').values_list()), lines)
+
+    def test_restore_nothing(self):
+        with self.assertNumQueries(0):
+            ArchivedOrder.restore([])
+            copy_rows(Order, ArchivedOrder, ArchivedOrder.ORDER_COLUMNS, 'id', [])
+
+    def test_generated_orders_skip_archived_ids(self):
+        ArchivedOrder.archive(timezone.now() + timedelta(days=1), batch_size=500)
+        archived_lines = set(ArchivedOrderProducts.objects.values_list('id', flat=True))
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('generate_catalog', scale=0.001, stdout=StringIO())
+
+        self.assertFalse(Order.objects.filter(id__in=[self.old_id, self.new_id]).exists())
+        self.assertFalse(OrderProducts.objects.filter(id__in=archived_lines).exists())
+        self.assertEqual(ArchivedOrder.restore([self.old_id]), [])
+        self.assertTrue(Order.objects.filter(id=self.old_id).exists())
+
+    def test_restore_skips_taken_ids(self):
+        ArchivedOrder.archive(timezone.now() + timedelta(days=1), batch_size=500)
+        Order.objects.create(id=self.old_id, customer=self.user)
+
+        self.assertEqual(ArchivedOrder.restore([self.old_id, self.new_id]), [self.old_id])
+        self.assertEqual(list(ArchivedOrder.objects.values_list('id', flat=True)), [self.old_id])
+        self.assertTrue(OrderProducts.objects.filter(order_id=self.new_id).exists())
+
+    def test_batches(self):
+        cutoff = timezone.now() + timedelta(days=1)
+
+        self.assertEqual(ArchivedOrder.archive(cutoff, batch_size=1), 1)
+        self.assertEqual(ArchivedOrder.archive(cutoff, batch_size=1), 1)
+        self.assertEqual(ArchivedOrder.archive(cutoff, batch_size=1), 0)
+
+    def test_rollups_include_archive(self):
+        call_command('rebuild_rollups', start=date(2000, 1, 1), stdout=StringIO())
+        before = list(DailyProductSales.objects.order_by('day', 'product').values_list('day', 'product', 'units'))
+        ArchivedOrder.archive(timezone.now() - timedelta(days=1), batch_size=500)
+        call_command('rebuild_rollups', start=date(2000, 1, 1), stdout=StringIO())
+
+        self.assertEqual(
+            list(DailyProductSales.objects.order_by('day', 'product').values_list('day', 'product', 'units')),
+            before,
+        )
+
+    def test_admin(self):
+        ArchivedOrder.archive(timezone.now() + timedelta(days=1), batch_size=500)
+        self.client.force_login(self.user)
+
+        self.assertEqual(self.client.get(f'/admin/shop/archivedorder/{self.old_id}/change/').status_code, 200)
+        response = self.client.post('/admin/shop/archivedorder/', {
+            'action': 'export_orders', '_selected_action': [self.old_id, self.new_id],
+        })
+        self.assertEqual(len(response.content.decode().splitlines()), 4)
+
+        self.client.post('/admin/shop/archivedorder/', {'action': 'restore', '_selected_action': [self.old_id]})
+        self.assertTrue(Order.objects.filter(id=self.old_id).exists())
+
+
+QUERY_PLANS = os.path.join(os.path.dirname(__file__), 'query_plans.json')
+# Tables small enough to be read whole.
+SCAN_ALLOWED = {'categories', 'subcategories'}
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [detail for _, _, _, detail in cursor.fetchall()]
+
+
+def full_scans(plan):
+    for detail in plan:
+        words = detail.split()
+        if words[0] == 'SCAN' and words[1] not in ('CONSTANT', 'SUBQUERY') and words[1] not in SCAN_ALLOWED:
+            yield detail
+
+
+class TestQueryPlans(TestCase):
+    # Plans of the hot paths on a generated catalog. Approve a changed plan
+    # with UPDATE_QUERY_PLANS=1 python manage.py test shop.tests.TestQueryPlans
+
+    @classmethod
+    def setUpTestData(cls):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('generate_catalog', scale=0.05, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = User.objects.order_by('id').first()
+        cls.product = Product.objects.order_by('-views').first()
+        cls.quantities = dict(Product.objects.order_by('id').values_list('id', 'id')[:3])
+        SavedCart.objects.create(user=cls.user).add(cls.quantities)
+
+    def hot_paths(self):
+        client = self.client
+        client.force_login(self.user)
+        request = RequestFactory().get('/')
+        product = self.product
+        yield 'navbar', lambda: [list(category.subcategories.all()) for category in navbar(request)['navbar_categories']]
+        yield 'product_list', lambda: client.get(product.subcategory.path)
+        yield 'product_list_filtered', lambda: client.get(product.subcategory.path, {'sort': 'price', 'page': 2})
+        yield 'product_detail', lambda: client.get(product.path)
+        yield 'reviews', lambda: client.get(product.path, {'partial': 1})
+        yield 'cart', lambda: client.get('/cart/')
+        yield 'checkout', lambda: Order.checkout(self.user, self.quantities)
+
+    def capture_plans(self):
+        catalog_generation()
+        plans = {}
+        for name, run in self.hot_paths():
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            plans[name] = [{'sql': query['sql'], 'plan': explain(query['sql'])}
+                           for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        return plans
+
+    def test_query_plans(self):
+        plans = self.capture_plans()
+
+        if os.environ.get('UPDATE_QUERY_PLANS'):
+            with open(QUERY_PLANS, 'w') as fh:
+                json.dump({name: [query['plan'] for query in queries] for name, queries in plans.items()},
+                          fh, ensure_ascii=False, indent=2)
+                fh.write('\n')
+
+        with open(QUERY_PLANS) as fh:
+            baseline = json.load(fh)
+
+        for name, queries in plans.items():
+            with self.subTest(name):
+                for query in queries:
+                    self.assertFalse(list(full_scans(query['plan'])), query['sql'])
+                self.assertEqual([query['plan'] for query in queries], baseline.get(name),
+                                 'The plan changed; approve it with UPDATE_QUERY_PLANS=1')
+
+    def test_full_scan_detected(self):
+        self.assertEqual(list(full_scans(explain("SELECT id FROM feedbacks WHERE name = 'Иван'"))),
+                         ['SCAN feedbacks'])
+        self.assertEqual(list(full_scans(explain('SELECT id FROM categories'))), [])
+
+
+class TestBulkPrices(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_admin_action(self):
+        self.client.force_login(User.objects.create_superuser('admin@example.com', 'testpassword'))
+        products = Product.objects.filter(subcategory=Product.objects.first().subcategory)
+        prices = dict(products.values_list('id', 'price'))
+        data = {'action': 'change_prices', '_selected_action': list(prices)}
+
+        response = self.client.post('/admin/shop/product/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'admin/shop/change_prices.html')
+
+        owner = {'user': User.objects.create_user('test@example.com', 'testpassword')}
+        SavedCart.objects.create(**owner).add({product_id: 1 for product_id in prices})
+        response = self.client.post('/admin/shop/product/', {**data, 'apply': '1', 'kind': 'percent', 'amount': '10'})
+
+        self.assertEqual(response.status_code, 302)
+        new_prices = {product_id: round(price * 1.1) for product_id, price in prices.items()}
+        self.assertEqual(dict(products.values_list('id', 'price')), new_prices)
+        self.assertEqual(Cart(owner).subtotal, sum(new_prices.values()))
+
+    def test_command(self):
+        product = Product.objects.first()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fh:
+            fh.write(f'id,price\n{product.id},12345\n999999,1\n')
+        stdout, stderr = StringIO(), StringIO()
+
+        try:
+            call_command('update_prices', fh.name, '--dry-run', stdout=stdout, stderr=stderr)
+            self.assertEqual(Product.objects.get(id=product.id).price, product.price)
+            call_command('update_prices', fh.name, stdout=stdout, stderr=stderr)
+        finally:
+            os.unlink(fh.name)
+
+        self.assertEqual(Product.objects.get(id=product.id).price, 12345)
+        self.assertIn('999999', stderr.getvalue())
+
+
+@override_settings(THROTTLE_RATES={'cart': '3/m', 'feedback': '2/10m'})
+class TestThrottling(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.first()
+        self.url = f'/cart/add/{self.product.id}/'
+
+    def add_to_cart(self, client):
+        return client.get(self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('30/m'), (30, 60))
+        self.assertEqual(parse_rate('5/10m'), (5, 600))
+        with self.assertRaises(ValueError):
+            parse_rate('5 per minute')
+
+    def test_cart_burst(self):
+        cart = save_cart(self.client, {})
+
+        statuses = [self.add_to_cart(self.client).status_code for _ in range(5)]
+
+        self.assertEqual(statuses, [200, 200, 200, 429, 429])
+        self.assertEqual(cart.quantities(), {self.product.id: 3})
+        response = self.add_to_cart(self.client)
+        self.assertIn('message', response.json())
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+
+        other = self.client_class(REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(self.add_to_cart(other).status_code, 200, 'Other clients have their own bucket')
+
+    def test_rotating_session_cookie(self):
+        statuses = []
+        for _ in range(5):
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = uuid.uuid4().hex
+            statuses.append(self.add_to_cart(self.client).status_code)
+
+        self.assertEqual(statuses, [200, 200, 200, 429, 429])
+
+    def test_users_counted_apart(self):
+        for email in ('first@example.com', 'second@example.com'):
+            self.client.force_login(User.objects.create_user(email, 'testpassword'))
+            self.assertEqual([self.add_to_cart(self.client).status_code for _ in range(4)], [200, 200, 200, 429])
+
+    def test_cache_calls(self):
+        save_cart(self.client, {})
+        self.add_to_cart(self.client)
+
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr, \
+                mock.patch.object(cache, 'add', wraps=cache.add) as add, \
+                mock.patch.object(cache, 'get', wraps=cache.get) as get:
+            self.add_to_cart(self.client)
+
+        self.assertEqual(incr.call_count + add.call_count, 1)
+        self.assertEqual(len([call for call in get.call_args_list if call.args[0].startswith('throttle:')]), 1,
+                         "One read of the previous period")
+
+    def request(self, remote_addr='10.0.0.1', **extra):
+        request = RequestFactory().get(self.url, REMOTE_ADDR=remote_addr, **extra)
+        request.user = AnonymousUser()
+        return request
+
+    def test_sliding_window(self):
+        request = self.request()
+        throttle = Throttle('cart')
+
+        with mock.patch('shop.throttling.time.time', return_value=6000.5):
+            self.assertEqual([throttle.consume(request) for _ in range(4)], [0, 0, 0, 60])
+        # A fixed window would let three more through right away.
+        with mock.patch('shop.throttling.time.time', return_value=6060):
+            self.assertEqual(throttle.consume(request), 20)
+        with mock.patch('shop.throttling.time.time', return_value=6080):
+            self.assertEqual([throttle.consume(request) for _ in range(2)], [0, 20])
+        with mock.patch('shop.throttling.time.time', return_value=6120):
+            self.assertEqual([throttle.consume(request) for _ in range(3)], [0, 0, 60])
+
+    def test_client_address(self):
+        forwarded = {'HTTP_X_FORWARDED_FOR': '6.6.6.6, 1.2.3.4, 10.0.0.5'}
+
+        self.assertEqual(Throttle.client(self.request(**forwarded)), 'ip:10.0.0.1')
+        with override_settings(THROTTLE_TRUSTED_PROXIES=1):
+            self.assertEqual(Throttle.client(self.request(**forwarded)), 'ip:10.0.0.5')
+            self.assertEqual(Throttle.client(self.request()), 'ip:10.0.0.1')
+        with override_settings(THROTTLE_TRUSTED_PROXIES=2):
+            self.assertEqual(Throttle.client(self.request(**forwarded)), 'ip:1.2.3.4', "The forged entry is ignored")
+        with override_settings(THROTTLE_TRUSTED_PROXIES=5):
+            self.assertEqual(Throttle.client(self.request(**forwarded)), 'ip:6.6.6.6')
+
+    @override_settings(THROTTLE_TRUSTED_PROXIES=1)
+    def test_clients_behind_proxy(self):
+        proxied = [self.client_class(REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR=address)
+                   for address in ('1.1.1.1', '2.2.2.2')]
+
+        self.assertEqual([self.add_to_cart(proxied[0]).status_code for _ in range(4)], [200, 200, 200, 429])
+        self.assertEqual(self.add_to_cart(proxied[1]).status_code, 200, 'Every client has its own bucket')
+
+    def test_feedback_burst(self):
+        data = {'name': 'John Doe', 'text': 'Five stars!', 'rating': 5, 'product': self.product.id}
+
+        statuses = [self.client.post(self.product.path, data).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(self.product.reviews.count(), 2)
+
+    @override_settings(THROTTLE_RATES={})
+    def test_disabled(self):
+        save_cart(self.client, {})
+        self.assertTrue(all(self.add_to_cart(self.client).status_code == 200 for _ in range(5)))
+
+
+class TestReplayLog(LiveServerTestCase):
+
+    def setUp(self):
+        self.product = create_product()
+        User.objects.create_user('user1@example.com', 'password')
+
+    def replay(self, *args):
+        # One client at a time: concurrent writes to the in-memory test
+        # database fail with "table is locked" instead of waiting.
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('replay_log', '--base-url', self.live_server_url, '--concurrency', '1',
+                         '--output', output.name, *args)
+            return json.load(output)
+
+    def test_synthetic_mix(self):
+        report = self.replay('--sessions', '6', '--checkout-share', '1', '--think', '0', '--allow-writes')
+
+        self.assertEqual(report['total']['errors'], 0, report)
+        self.assertEqual(Order.objects.count(), 6)
+        for name in ('product', 'product-fragment', 'cart-add', 'cart', 'login', 'new-order'):
+            self.assertIn(name, report['url_names'])
+        product = report['url_names']['product']
+        self.assertLessEqual(product['p50_ms'], product['p95_ms'])
+        self.assertLessEqual(product['p95_ms'], product['p99_ms'])
+        self.assertEqual(report['total']['requests'], sum(name['requests'] for name in report['url_names'].values()))
+
+    def test_log(self):
+        product = self.product
+        lines = [
+            json.dumps({'time': 0, 'session': 'a', 'path': product.path}),
+            json.dumps({'time': 0.1, 'session': 'a', 'path': f'/cart/add/{product.id}/'}),
+            json.dumps({'time': 0.2, 'session': 'a', 'path': '/cart/'}),
+            json.dumps({'time': 0.2, 'session': 'b', 'method': 'POST', 'path': product.path,
+                        'data': {'name': 'Иван', 'text': 'Отлично', 'rating': 5, 'product': product.id}}),
+            '10.0.0.1 - - [19/Oct/2026:10:00:00 +0000] "GET /missing/ HTTP/1.1" 404 10 "-" "curl"',
+            '10.0.0.1 - - [19/Oct/2026:10:00:00 +0000] "GET /static/css/main.css HTTP/1.1" 200 10 "-" "curl"',
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as log:
+            log.write('\n'.join(lines))
+            log.flush()
+            read_only = self.replay('--log', log.name)
+            self.assertEqual(read_only['total']['requests'], 3)
+            self.assertEqual(read_only['skipped_writes'], 2)
+            self.assertFalse(SavedCart.objects.exists())
+
+            report = self.replay('--log', log.name, '--allow-writes')
+
+        self.assertEqual(report['total']['requests'], 5)
+        self.assertEqual(report['url_names']['cart-add']['statuses'], {'200': 1})
+        self.assertEqual(report['url_names']['product']['statuses'], {'200': 1, '302': 1})
+        self.assertEqual(report['url_names']['unresolved']['errors'], 1)
+        self.assertEqual(SavedCart.objects.get().quantities(), {product.id: 1})
+        self.assertEqual(product.reviews.count(), 1)
+
+    def test_read_only_by_default(self):
+        report = self.replay('--sessions', '6', '--checkout-share', '1', '--think', '0')
+
+        self.assertEqual(report['total']['errors'], 0, report)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Feedback.objects.exists())
+        self.assertFalse(SavedCart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+        self.assertNotIn('new-order', report['url_names'])
+        self.assertNotIn('cart-add', report['url_names'])
+
+    def test_remote_host_needs_allow_writes(self):
+        with self.assertRaisesMessage(CommandError, '--allow-writes'):
+            call_command('replay_log', '--base-url', 'https://shop.example.com', '--sessions', '1')
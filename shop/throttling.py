@@ -0,0 +1,104 @@
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+
+from . import metrics
+
+RATE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+MESSAGE = 'Слишком много запросов, попробуйте позже.'
+
+
+def parse_rate(rate):
+    # '30/m' is 30 requests a minute, '5/10m' is 5 requests in 10 minutes.
+    match = RATE.match(rate)
+    if not match:
+        raise ValueError(f'Invalid throttle rate: {rate!r}')
+    capacity, multiplier, unit = match.groups()
+    return int(capacity), int(multiplier or 1) * PERIODS[unit]
+
+
+def client_address(request):
+    # Each trusted proxy appends the address it received the request from,
+    # so the client is the entry added by the outermost one. Anything to
+    # its left was sent by the client and can be forged.
+    proxies = settings.THROTTLE_TRUSTED_PROXIES
+    forwarded = request.META.get(settings.THROTTLE_PROXY_HEADER, '')
+    addresses = [address.strip() for address in forwarded.split(',') if address.strip()]
+    if proxies and addresses:
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR')
+
+
+class Throttle:
+    # A sliding window of one period, estimated from two fixed-period
+    # counters: the requests of the current period plus those of the
+    # previous one weighted by the share of it still inside the window.
+    # Unlike a single fixed period, this does not let twice the capacity
+    # through around the start of a period; the estimate assumes the
+    # previous period's requests were spread evenly, so the limit is
+    # approximate.
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.capacity, self.period = parse_rate(settings.THROTTLE_RATES[scope])
+
+    @staticmethod
+    def client(request):
+        if request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        # Anonymous clients choose their session cookie, a new one for
+        # every request if they like, so they are counted by address.
+        return f'ip:{client_address(request)}'
+
+    def consume(self, request):
+        # Returns 0 if the request may proceed, otherwise the number of
+        # seconds until it would.
+        now = time.time()
+        period, elapsed = divmod(now, self.period)
+        prefix = f'throttle:{self.scope}:{self.client(request)}'
+        key = f'{prefix}:{int(period)}'
+
+        try:
+            spent = cache.incr(key)
+        except ValueError:
+            # The counter is read during the next period too.
+            spent = 1 if cache.add(key, 1, 2 * self.period) else cache.incr(key)
+        previous = cache.get(f'{prefix}:{int(period) - 1}', 0)
+
+        remaining = 1 - elapsed / self.period
+        if spent + previous * remaining <= self.capacity:
+            return 0
+
+        # Rejected requests do not count.
+        cache.decr(key)
+        if spent > self.capacity:
+            return math.ceil(self.period - elapsed)
+        # The previous period has to slide out far enough.
+        return math.ceil(self.period * (previous + spent - self.capacity) / previous - elapsed)
+
+
+class ThrottleMixin:
+    throttle_scope = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.throttle_scope in settings.THROTTLE_RATES:
+            retry_after = Throttle(self.throttle_scope).consume(request)
+            if retry_after:
+                metrics.registry.inc('throttled_requests_total', scope=self.throttle_scope)
+                return self.throttled(request, retry_after)
+        return super().dispatch(request, *args, **kwargs)
+
+    def throttled(self, request, retry_after):
+        if request.is_ajax():
+            response = JsonResponse({'message': MESSAGE}, status=429)
+        else:
+            response = HttpResponse(MESSAGE, content_type='text/plain; charset=utf-8', status=429)
+        response['Retry-After'] = str(retry_after)
+        patch_cache_control(response, private=True)
+        return response
@@ -34,7 +34,31 @@ urlpatterns = [
     path('catalog/<slug:category>/<slug:subcategory>/<slug:product>/',
          views.ProductView.as_view(),
          name='product'),
+    path('fragments/product/<int:pk>/',
+         views.ProductFragment.as_view(),
+         name='product-fragment'),
+    path('suggestions/',
+         views.Suggestions.as_view(),
+         name='suggestions'),
     path('article/<slug:title>/',
          views.ArticleView.as_view(),
-         name='article')
+         name='article'),
+    path('sitemap.xml',
+         views.SitemapIndex.as_view(),
+         name='sitemap'),
+    path('sitemap-pages.xml',
+         views.PagesSitemap.as_view(),
+         name='sitemap-pages'),
+    path('sitemap-products-<int:chunk>.xml',
+         views.ProductsSitemap.as_view(),
+         name='sitemap-products'),
+    path('feed.csv',
+         views.CsvFeed.as_view(),
+         name='feed-csv'),
+    path('feed.yml',
+         views.YmlFeed.as_view(),
+         name='feed-yml'),
+    path('metrics',
+         views.Metrics.as_view(),
+         name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,16 +1,34 @@
+import hmac
+import uuid
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.views import LoginView
-from django.http import JsonResponse, HttpResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
 from django.views.generic import CreateView, DetailView, FormView, TemplateView, ListView
 from django.views.generic import View
 from django.views.generic.detail import SingleObjectMixin
 
+from . import feeds, metrics
+from .cache import catalog_generation
 from .cart import Cart
-from .forms import SignupForm, FeedbackForm
-from .models import Product, Category, Subcategory, Order, Article
+from .counters import product_views
+from .filters import ProductFilter
+from .forms import SignupForm, FeedbackForm, ProductFilterForm
+from .models import Product, Category, Subcategory, Order, Article, ProductRanking, SavedCart, CartLine
+from .suggestions import suggestion_index
+from .throttling import ThrottleMixin
+from .warmup import WARMUP_USER_AGENT
+from .tasks import notify_new_review, send_order_confirmation
 
 
 class SignUp(CreateView):
@@ -35,19 +53,67 @@ class Login(LoginView):
         return super().get_context_data(**kwargs)
 
 
-class HomeView(ListView):
+class PublicCacheMixin:
+    # The shared version depends on no cookie but those in
+    # PUBLIC_CACHE_BYPASS_COOKIES, and the edge passes requests carrying
+    # them through. There is no Vary: Cookie: the fragment sets csrftoken
+    # on every visitor, so it would store one copy per visitor.
+
+    def dispatch(self, request, *args, **kwargs):
+        shareable = request.method in ('GET', 'HEAD') and not any(
+            cookie in request.COOKIES for cookie in settings.PUBLIC_CACHE_BYPASS_COOKIES
+        )
+        if shareable:
+            request.user = AnonymousUser()
+
+        response = super().dispatch(request, *args, **kwargs)
+
+        shareable = shareable and not request.session.accessed and not request.META.get('CSRF_COOKIE_USED')
+        if shareable:
+            patch_cache_control(response, public=True, max_age=0, s_maxage=settings.PUBLIC_CACHE_MAX_AGE)
+        else:
+            patch_cache_control(response, private=True)
+        return response
+
+
+class PartialTemplateMixin:
+    # XHR requests and ?partial=1 get only the content fragment, without
+    # the layout and the navbar.
+    partial_template_name = None
+
+    def dispatch(self, request, *args, **kwargs):
+        request.partial = request.is_ajax() or request.GET.get('partial') == '1'
+        response = super().dispatch(request, *args, **kwargs)
+        patch_vary_headers(response, ('X-Requested-With',))
+        return response
+
+    def get_template_names(self):
+        if self.request.partial:
+            return [self.partial_template_name]
+        return super().get_template_names()
+
+
+class HomeView(PublicCacheMixin, ListView):
     template_name = 'shop/home.html'
     model = Article
     context_object_name = 'articles'
     ordering = ['-date_posted']
+    popular_products = 6
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset. \
-            prefetch_related('products', 'products__category', 'products__subcategory',)[:6]
+        return queryset.prefetch_related(Prefetch('products', Product.objects.for_links()))[:6]
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        context['popular_products'] = ProductRanking.objects. \
+            select_related('product'). \
+            only('rank', 'product__title', 'product__price', 'product__path'). \
+            order_by('rank')[:self.popular_products]
+        return context
 
 
-class ArticleView(DetailView):
+class ArticleView(PublicCacheMixin, DetailView):
     context_object_name = 'article'
     model = Article
     slug_url_kwarg = 'title'
@@ -55,10 +121,10 @@ class ArticleView(DetailView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset.prefetch_related('products__category', 'products__subcategory')
+        return queryset.prefetch_related(Prefetch('products', Product.objects.for_links()))
 
 
-class SubcategoryList(ListView):
+class SubcategoryList(PublicCacheMixin, ListView):
     model = Subcategory
 
     def dispatch(self, request, *args, **kwargs):
@@ -69,7 +135,7 @@ class SubcategoryList(ListView):
         category = Category.objects.filter(slug=self.slug).first()
         self.category_title = category.title
         queryset = super().get_queryset()
-        return queryset.filter(category=category).prefetch_related('category')
+        return queryset.filter(category=category)
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -77,60 +143,109 @@ class SubcategoryList(ListView):
         return context
 
 
-class ProductList(ListView):
+class ProductList(PublicCacheMixin, PartialTemplateMixin, ListView):
     model = Product
     paginate_by = 4
-    ordering = ['-title']
+    partial_template_name = 'shop/product_list_content.html'
 
     def dispatch(self, request, *args, **kwargs):
         self.slug = self.kwargs.get('subcategory')
+        self.filter = ProductFilter(request.GET)
         return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
         subcategory = Subcategory.objects.filter(slug=self.slug).first()
+        self.subcategory = subcategory
         self.subcategory_title = subcategory.title
-        queryset = super().get_queryset()
-        return queryset.filter(subcategory=subcategory).prefetch_related('subcategory', 'category')
+        queryset = super().get_queryset().for_listing().filter(subcategory=subcategory)
+        return self.filter.filter(queryset)
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['subcategory_title'] = self.subcategory_title
+        context['filter'] = self.filter
+        context['facets'] = self.filter.facets(self.subcategory.products.all(), self.subcategory)
+        context['sorting'] = ProductFilterForm.SORTING
         return context
 
 
-class ProductDetail(DetailView):
-    model = Product
-    slug_url_kwarg = 'product'
+class ProductShellMixin:
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['form'] = FeedbackForm(initial={'product': self.object})
+        context['catalog_generation'] = catalog_generation()
+        context['shell_timeout'] = settings.CATALOG_CACHE_TIMEOUT
         return context
 
+
+class ProductDetail(ProductShellMixin, PartialTemplateMixin, DetailView):
+    model = Product
+    slug_url_kwarg = 'product'
+    partial_template_name = 'shop/product_reviews.html'
+
     def get_queryset(self):
-        queryset = super().get_queryset()
-        return queryset.prefetch_related('reviews')
+        return super().get_queryset().for_detail()
 
 
-class ProductFeedback(SingleObjectMixin, FormView):
+class ProductFeedback(ThrottleMixin, ProductShellMixin, PartialTemplateMixin, SingleObjectMixin, FormView):
     template_name = 'shop/product_detail.html'
+    throttle_scope = 'feedback'
+    partial_template_name = 'shop/product_reviews.html'
     model = Product
     form_class = FeedbackForm
     slug_url_kwarg = 'product'
 
+    def get_queryset(self):
+        return super().get_queryset().for_detail()
+
     def post(self, request, *args, **kwargs):
         self.object = self.get_object()
         return super().post(request, *args, **kwargs)
 
     def form_valid(self, form):
-        form.save()
+        feedback = form.save()
+        notify_new_review.delay(feedback.id)
+        if self.request.partial:
+            return self.render_to_response(self.get_context_data(feedback_saved=True))
+        messages.success(self.request, 'Спасибо за отзыв!')
         return super().form_valid(form)
 
+    def form_invalid(self, form):
+        if self.request.partial:
+            return self.response_class(request=self.request, template='shop/product_fragment.html',
+                                       context=self.get_context_data(form=form), status=400)
+        return super().form_invalid(form)
+
     def get_success_url(self):
         return self.object.get_absolute_url()
 
 
-class ProductView(View):
+@method_decorator(never_cache, name='dispatch')
+class ProductFragment(DetailView):
+    model = Product
+    template_name = 'shop/product_fragment.html'
+
+    def get_queryset(self):
+        return super().get_queryset().only('id', 'path')
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # Every product page loads the fragment, also when the page itself
+        # comes from the edge cache; warm_cache does not count.
+        if request.META.get('HTTP_USER_AGENT') != WARMUP_USER_AGENT:
+            product_views.hit(self.object.id)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['form'] = FeedbackForm(initial={'product': self.object})
+        if owner := SavedCart.owner(self.request):
+            lines = CartLine.for_owner(owner).filter(product=self.object)
+            context['cart_qty'] = lines.values_list('quantity', flat=True).first()
+        return context
+
+
+class ProductView(PublicCacheMixin, View):
 
     def get(self, request, *args, **kwargs):
         view = ProductDetail.as_view()
@@ -141,7 +256,16 @@ class ProductView(View):
         return view(request, *args, **kwargs)
 
 
-class AddProductToCart(View):
+class Suggestions(PublicCacheMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '')[:settings.SUGGESTIONS_MAX_QUERY_LENGTH]
+        suggestions = suggestion_index.suggest(query, settings.SUGGESTIONS_LIMIT)
+        return JsonResponse({'suggestions': suggestions})
+
+
+class AddProductToCart(ThrottleMixin, View):
+    throttle_scope = 'cart'
 
     def dispatch(self, request, *args, **kwargs):
         self.pk = str(self.kwargs.get('product_id'))
@@ -153,9 +277,6 @@ class AddProductToCart(View):
         success_message = 'Добавлено!'
         failure_message = 'Ошибка, попробуйте еще раз.'
 
-        if 'cart' not in request.session:
-            request.session['cart'] = {}
-
         if self.product_exists():
             self.update_cart()
             return JsonResponse({'message': success_message})
@@ -166,35 +287,27 @@ class AddProductToCart(View):
         return Product.objects.filter(id__exact=self.pk).exists()
 
     def update_cart(self):
-        product_qty = self.request.session['cart'].get(self.pk, 0)
-        self.request.session['cart'][self.pk] = product_qty + 1
-        self.request.session.modified = True
+        SavedCart.for_request(self.request, create=True).add({self.pk: 1})
+        metrics.registry.inc('shop_cart_additions_total')
 
 
-class CartView(TemplateView):
+class CartView(PartialTemplateMixin, TemplateView):
     template_name = 'shop/cart.html'
+    partial_template_name = 'shop/cart_content.html'
 
     def get(self, request, *args, **kwargs):
-        session_cart = request.session.get('cart')
+        owner = SavedCart.owner(request)
 
-        if session_cart and request.GET.get('clear'):
-            return self.clean_cart()
-
-        if session_cart:
-            context = self.get_cart(session_cart)
-        else:
-            context = self.get_context_data()
+        if owner and request.GET.get('clear'):
+            return self.clean_cart(owner)
 
+        context = self.get_context_data(cart=Cart(owner), idempotency_key=uuid.uuid4())
         return self.render_to_response(context)
 
-    def clean_cart(self):
-        del self.request.session['cart']
+    def clean_cart(self, owner):
+        CartLine.for_owner(owner).delete()
         return redirect('cart')
 
-    def get_cart(self, session_cart):
-        cart = Cart(session_cart)
-        return self.get_context_data(cart=cart)
-
 
 class NewOrder(LoginRequiredMixin, TemplateView):
     template_name = 'shop/order_success.html'
@@ -204,14 +317,85 @@ class NewOrder(LoginRequiredMixin, TemplateView):
         return redirect('cart')
 
     def post(self, request, *args, **kwargs):
-        if cart := self.request.session.get('cart'):
-            order_id = Order.checkout(request.user, cart)
-            del request.session['cart']
-            context = self.get_context_data(order_id=order_id)
-            return self.render_to_response(context)
-        else:
-            redirect('cart')
+        try:
+            key = uuid.UUID(request.POST.get('idempotency_key', ''))
+        except ValueError:
+            key = None
+
+        # A retried submit finds its order before the emptied cart.
+        if order_id := Order.placed(request.user, key):
+            return self.render_to_response(self.get_context_data(order_id=order_id))
+
+        if not (cart := Cart(SavedCart.owner(request))):
+            return redirect('cart')
+
+        with transaction.atomic():
+            order_id, created = Order.place(request.user, cart.quantities(), key)
+            SavedCart.objects.get(user=request.user).clear()
+        if created:
+            send_order_confirmation.delay(order_id)
+            metrics.registry.inc('shop_checkouts_total')
+        context = self.get_context_data(order_id=order_id)
+        return self.render_to_response(context)
 
     def handle_no_permission(self):
         self.request.session['from_neworder'] = True
         return super().handle_no_permission()
+
+
+class CachedFileView(View):
+    content_type = None
+    filename = None
+
+    def get(self, request, *args, **kwargs):
+        base_url = request.build_absolute_uri('/').rstrip('/')
+        fh = feeds.cached_file(self.get_filename(), base_url)
+        return FileResponse(fh, content_type=self.content_type)
+
+    def get_filename(self):
+        return self.filename
+
+
+class SitemapIndex(CachedFileView):
+    content_type = 'application/xml'
+    filename = 'sitemap.xml'
+
+
+class PagesSitemap(CachedFileView):
+    content_type = 'application/xml'
+    filename = 'sitemap-pages.xml'
+
+
+class ProductsSitemap(CachedFileView):
+    content_type = 'application/xml'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.chunk = self.kwargs.get('chunk')
+        if not 1 <= self.chunk <= feeds.product_chunks():
+            raise Http404
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_filename(self):
+        return f'sitemap-products-{self.chunk}.xml'
+
+
+class CsvFeed(CachedFileView):
+    content_type = 'text/csv; charset=utf-8'
+    filename = 'feed.csv'
+
+
+class YmlFeed(CachedFileView):
+    content_type = 'application/xml'
+    filename = 'feed.yml'
+
+
+class Metrics(View):
+
+    def get(self, request, *args, **kwargs):
+        # Behind a proxy every request comes from its address, so the
+        # scraper has to present the token instead.
+        token = settings.METRICS_TOKEN
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not token or not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            raise Http404
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,35 @@
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import translation
+
+# Sent by warm_cache, so that its requests are not counted as visits.
+WARMUP_USER_AGENT = 'warm_cache'
+
+
+def template_names(prefixes):
+    for app_config in apps.get_app_configs():
+        directory = os.path.join(app_config.path, 'templates')
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                if name.startswith(prefixes):
+                    yield name
+
+
+def warm_up():
+    # Everything here is cached per process on first use: the URL
+    # resolver, translation catalogs, compiled templates (with the cached
+    # loader) and model metadata.
+    reverse('home')
+
+    with translation.override(settings.LANGUAGE_CODE):
+        for name in template_names(('shop/', 'admin/shop/', f'{settings.CRISPY_TEMPLATE_PACK}/')):
+            get_template(name)
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+        str(model._default_manager.all().query)
@@ -13,13 +13,116 @@ function addToCart(productID, $element) {
             dataType: 'json',
             success: function (response) {
                 console.log('Done!', response);
-                $element.popover({
-                    content: response.message,
-                    placement: 'top',
-                    trigger: 'focus'
-                });
-                $element.popover('show')
+                showPopover($element, response.message);
+            },
+            error: function (xhr) {
+                if (xhr.responseJSON) {
+                    showPopover($element, xhr.responseJSON.message);
+                }
             }
         }
     )
 }
+
+function showPopover($element, message) {
+    $element.popover('dispose').popover({
+        content: message,
+        placement: 'top',
+        trigger: 'focus'
+    });
+    $element.popover('show')
+}
+
+$('[data-fragment-url]').each(function () {
+    const $element = $(this);
+    $.get($element.data('fragmentUrl'), function (html) {
+        $element.replaceWith(html);
+    });
+});
+
+// Containers marked with data-partial reload only their own content when
+// a query link inside them is clicked.
+function loadPartial($container, url, push) {
+    $.get(url, function (html) {
+        $container.html(html);
+        if (push) {
+            history.pushState({partial: $container.attr('id')}, '', url);
+        }
+    });
+}
+
+$('[data-partial]').on('click', 'a[href^="?"]', function (event) {
+    const $container = $(event.delegateTarget);
+    event.preventDefault();
+    loadPartial($container, this.href, $container.is('[data-partial-history]'));
+});
+
+$('[data-partial-history]').each(function () {
+    history.replaceState({partial: this.id}, '', document.location.href);
+});
+
+window.addEventListener('popstate', function (event) {
+    if (event.state && event.state.partial) {
+        loadPartial($('#' + event.state.partial), document.location.href, false);
+    }
+});
+
+$('#review-form').on('submit', 'form', function (event) {
+    const $form = $(this);
+    event.preventDefault();
+    $.post($form.attr('action'), $form.serialize())
+        .done(function (html) {
+            $('#reviews').html(html);
+            $form[0].reset();
+        })
+        .fail(function (xhr) {
+            if (xhr.status === 400) {
+                $('#review-form').html(xhr.responseText);
+            } else if (xhr.status === 429) {
+                alert(xhr.responseJSON.message);
+            }
+        });
+});
+
+// Typeahead for the navbar search box; Enter opens the first suggestion.
+let suggestionsRequest = null;
+let suggestionsTimer = null;
+
+function showSuggestions(suggestions) {
+    const $menu = $('#search-suggestions').empty();
+    suggestions.forEach(function (suggestion) {
+        $('<a class="dropdown-item">')
+            .attr('href', suggestion.url)
+            .addClass('suggestion-' + suggestion.kind)
+            .text(suggestion.title)
+            .appendTo($menu);
+    });
+    $menu.toggleClass('show', suggestions.length > 0);
+}
+
+$('#search').on('input', 'input', function () {
+    const query = $.trim(this.value);
+    clearTimeout(suggestionsTimer);
+    if (suggestionsRequest) {
+        suggestionsRequest.abort();
+    }
+    if (!query) {
+        showSuggestions([]);
+        return;
+    }
+    suggestionsTimer = setTimeout(function () {
+        suggestionsRequest = $.getJSON($('#search').data('suggestionsUrl'), {q: query}, function (response) {
+            showSuggestions(response.suggestions);
+        });
+    }, 150);
+}).on('submit', function (event) {
+    const $first = $('#search-suggestions a').first();
+    event.preventDefault();
+    if ($first.length) {
+        document.location = $first.attr('href');
+    }
+}).on('focusout', function () {
+    setTimeout(function () {
+        $('#search-suggestions').removeClass('show');
+    }, 200);
+});
@@ -46,12 +46,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shop.middleware.MetricsMiddleware',
+    'shop.middleware.CompressionMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -135,6 +138,95 @@ LOGIN_REDIRECT_URL = LOGOUT_REDIRECT_URL = '/'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+CATALOG_CACHE_TIMEOUT = 60 * 15
+# How long a worker may keep a cached copy of the catalog generation.
+CATALOG_GENERATION_TIMEOUT = 60
+
+TASK_VISIBILITY_TIMEOUT = 60 * 5
+TASK_RETRY_DELAY = 30
+
+# Orders older than this move to the archive tables (archive_orders).
+ORDER_ARCHIVE_AFTER_DAYS = 365
+
+# Anonymous carts untouched for this long are deleted (expire_carts). Their
+# token lives in the session, so this should outlast SESSION_COOKIE_AGE.
+CART_EXPIRE_AFTER_DAYS = 30
+
+VIEW_COUNTER_FLUSH_INTERVAL = 30
+VIEW_COUNTER_FLUSH_THRESHOLD = 100
+
+POPULAR_PRODUCTS_SIZE = 50
+POPULAR_PRODUCTS_DAYS = 30
+POPULAR_PRODUCTS_SALE_WEIGHT = 20
+
+# Requests per client (user or address) to write endpoints: '30/m' is 30
+# a minute, '5/10m' is 5 in ten minutes.
+THROTTLE_RATES = {
+    'cart': '30/m',
+    'feedback': '5/10m',
+}
+# Number of proxies in front of the site (nginx, the CDN) that append the
+# address they received a request from to this header. With 0 the client
+# address is REMOTE_ADDR; behind a proxy that would put every anonymous
+# visitor into one bucket.
+THROTTLE_PROXY_HEADER = 'HTTP_X_FORWARDED_FOR'
+THROTTLE_TRUSTED_PROXIES = 0
+
+# Search suggestions come from an in-process index that is rebuilt when
+# the catalog generation changes.
+SUGGESTIONS_LIMIT = 8
+SUGGESTIONS_MAX_QUERY_LENGTH = 100
+# Suggestions are ranked by views, so the index is rebuilt at least this often.
+SUGGESTIONS_MAX_AGE = 60 * 60
+
+FEED_CACHE_DIR = os.path.join(BASE_DIR, 'var', 'feeds')
+FEED_BATCH_SIZE = 2000
+SITEMAP_CHUNK_SIZE = 50000
+# The first request that finds a feed outdated queues a run_tasks task to
+# rewrite it and gets the previous file; another is queued after this
+# many seconds if the file is still missing.
+FEED_BUILD_TIMEOUT = 60 * 10
+
+# Anonymous catalog pages are sent with Cache-Control: public and without
+# Vary: Cookie. The edge cache must pass through requests carrying any of
+# these cookies and leave the others (csrftoken) out of its cache key.
+PUBLIC_CACHE_MAX_AGE = 60 * 5
+PUBLIC_CACHE_BYPASS_COOKIES = ['sessionid', 'messages']
+CACHE_PURGE_BACKEND = 'shop.purge.log_purge'
+
+# Staff can profile a request with the X-Profile header or ?profile=1.
+PROFILING_DIR = os.path.join(BASE_DIR, 'var', 'profiles')
+PROFILING_SAMPLE_RATE = 0
+
+# The default cache counts hits and misses for /metrics.
+CACHES = {
+    'default': {
+        'BACKEND': 'shop.metrics.LocMemCache',
+    }
+}
+
+# Every process writes its metrics to its own file here; clear the
+# directory when deploying.
+METRICS_DIR = os.path.join(BASE_DIR, 'var', 'metrics')
+METRICS_FLUSH_INTERVAL = 10
+# /metrics answers only to 'Authorization: Bearer <token>'; without a
+# token it is disabled.
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN')
+
+WARMUP_ON_STARTUP = False
+
+# Responses are compressed with brotli when the package is installed and
+# the client accepts it, with gzip otherwise.
+COMPRESSION_MIN_LENGTH = 500
+COMPRESSIBLE_CONTENT_TYPES = [
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+]
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
 try:
     from .settings_local import *
 except ImportError:
@@ -144,3 +236,4 @@ if DEBUG:
     INTERNAL_IPS = [
         '127.0.0.1',
     ]
+    EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -0,0 +1,52 @@
+"""
+Production settings: DJANGO_SETTINGS_MODULE=transpozon.settings_production
+
+Secrets and hosts come from the environment, dev-only apps are dropped and
+templates are minified and compiled once per process.
+"""
+
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, TEMPLATES
+
+DEBUG = os.environ.get('DJANGO_DEBUG') == '1'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set the DJANGO_SECRET_KEY environment variable')
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '').split()
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if not middleware.startswith('debug_toolbar.')]
+
+TEMPLATES = copy.deepcopy(TEMPLATES)
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        ('shop.template_loaders.MinifyingLoader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]),
+]
+
+# Workers share the cache: catalog generation, cached pages and facets,
+# throttle counters. Space-separated host:port list.
+CACHES = {
+    'default': {
+        'BACKEND': 'shop.metrics.MemcachedCache',
+        'LOCATION': os.environ.get('DJANGO_MEMCACHED_LOCATION', '127.0.0.1:11211').split(),
+    }
+}
+
+# nginx, plus one for the CDN when it is enabled.
+THROTTLE_TRUSTED_PROXIES = int(os.environ.get('DJANGO_TRUSTED_PROXIES', '1'))
+
+EMAIL_BACKEND = os.environ.get('DJANGO_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+
+# Compile templates, resolve URLs and load model metadata when the WSGI
+# module is imported, so a preloading server does it before forking.
+WARMUP_ON_STARTUP = True
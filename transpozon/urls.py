@@ -22,7 +22,7 @@ urlpatterns = [
     path('', include('shop.urls'))
 ]
 
-if settings.DEBUG:
+if settings.DEBUG and 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
 
     urlpatterns = [
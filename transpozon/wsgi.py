@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transpozon.settings')
 
 application = get_wsgi_application()
+
+if settings.WARMUP_ON_STARTUP:
+    from shop.suggestions import suggestion_index
+    from shop.warmup import warm_up
+
+    warm_up()
+    suggestion_index.refresh()
+    # Workers forked from a preloaded application must not share it.
+    connections.close_all()